@@ -1,5 +1,4 @@
 import streamlit as st
-import json
 import pandas as pd
 import plotly.express as px
 from datetime import datetime, timedelta
@@ -7,6 +6,10 @@ import numpy as np
 import os
 from io import BytesIO
 
+from catalog import Catalog, assign_skus, next_sku
+from datastore import merge_records, update_json
+from order_journal import OrderJournal
+
 # 設置頁面配置
 st.set_page_config(
     page_title="海鮮購物網後台管理系統",
@@ -17,28 +20,35 @@ st.set_page_config(
 # 確保數據目錄存在
 os.makedirs('data', exist_ok=True)
 
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+PRODUCTS_PATH = os.path.join(DATA_DIR, 'products.json')
+
+# 商品目錄（每個進程共用一份，前台扣除的庫存數秒內生效）
+@st.cache_resource
+def get_catalog():
+    return Catalog(PRODUCTS_PATH)
+
+# 訂單日誌（每個進程共用一份，所有 session 一起使用）
+@st.cache_resource
+def get_order_journal():
+    return OrderJournal(DATA_DIR)
+
+# 載入商品數據（可編輯的複本，另存一份讀取時的版本供寫回時合併）
+def load_products():
+    snapshot = get_catalog().snapshot()
+    st.session_state.products = snapshot.copy()
+    st.session_state.products_base = snapshot.copy()
+    st.session_state.products_version = snapshot.version
+
 # 載入數據函數
 def load_data():
-    # 獲取當前文件的目錄
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    data_dir = os.path.join(base_dir, 'data')
-
-    # 載入商品數據
-    try:
-        with open(os.path.join(data_dir, 'products.json'), 'r', encoding='utf-8') as f:
-            products = json.load(f)
-            st.session_state.products = products
-            print(f"成功載入 {len(products)} 個商品")
-    except Exception as e:
-        print(f"載入商品數據時出錯: {str(e)}")
-        st.session_state.products = []
+    load_products()
 
     # 載入訂單數據
     try:
-        with open(os.path.join(data_dir, 'orders.json'), 'r', encoding='utf-8') as f:
-            orders = json.load(f)
-            st.session_state.orders = orders
-            print(f"成功載入 {len(orders)} 個訂單")
+        orders = get_order_journal().orders()
+        st.session_state.orders = orders
+        print(f"成功載入 {len(orders)} 個訂單")
     except Exception as e:
         print(f"載入訂單數據時出錯: {str(e)}")
         st.session_state.orders = []
@@ -47,16 +57,36 @@ def load_data():
 if 'initialized' not in st.session_state:
     st.session_state.initialized = True
     load_data()
+elif get_catalog().snapshot().version != st.session_state.products_version:
+    # 商品檔已被修改（例如前台結帳扣除庫存），改用最新的版本
+    load_products()
+
+# 本次 rerun 使用的商品快照（以商品編號查詢）
+catalog = get_catalog().snapshot()
 
 # 保存商品數據
+# 商品檔在讀取後被修改過（例如前台結帳扣除庫存）時，與最新內容合併後再寫回
 def save_products():
-    with open('data/products.json', 'w', encoding='utf-8') as f:
-        json.dump(st.session_state.products, f, ensure_ascii=False, indent=2)
+    assign_skus(st.session_state.products)
+    base = st.session_state.products_base
+    base_version = st.session_state.products_version
+    mine = st.session_state.products
+
+    def merge(current, version):
+        if version == base_version:
+            return mine
+        return merge_records(base, mine, current, key="編號", additive=("庫存",))
+
+    products, version = update_json(PRODUCTS_PATH, merge)
+    st.session_state.products = [dict(product) for product in products]
+    st.session_state.products_base = [dict(product) for product in products]
+    st.session_state.products_version = version
+    get_catalog().invalidate()
 
-# 保存訂單數據
-def save_orders():
-    with open('data/orders.json', 'w', encoding='utf-8') as f:
-        json.dump(st.session_state.orders, f, ensure_ascii=False, indent=2)
+# 更新訂單狀態（附加一行到訂單日誌）
+def update_order_status(order, status):
+    get_order_journal().update(order['訂單號'], {'狀態': status})
+    order['狀態'] = status
 
 # 側邊欄
 st.sidebar.title("功能選單")
@@ -87,6 +117,7 @@ if page == "商品管理":
             if st.form_submit_button("新增"):
                 if name and category and price and spec:
                     new_product = {
+                        "編號": next_sku(st.session_state.products),
                         "名稱": name,
                         "類別": category,
                         "價格": price,
@@ -111,7 +142,8 @@ if page == "商品管理":
         edited_df = st.data_editor(
             df,
             hide_index=True,
-            use_container_width=True
+            use_container_width=True,
+            disabled=["編號"]
         )
         
         # 刪除選中的商品
@@ -189,7 +221,7 @@ elif page == "訂單管理":
                     '客戶名稱': order['客戶名稱'],
                     '電話': order['電話'],
                     '取貨地點': order['取貨地點'],
-                    '商品名稱': item['商品名稱'],
+                    '商品名稱': catalog.item_name(item),
                     '數量': item['數量'],
                     '單價': item['單價'],
                     '小計': item['小計'],
@@ -257,8 +289,7 @@ elif page == "訂單管理":
                 )
                 
                 if new_status != order['狀態']:
-                    order['狀態'] = new_status
-                    save_orders()
+                    update_order_status(order, new_status)
                     st.success("訂單狀態已更新！")
         
         # 分頁控制（在所有訂單顯示完後）
@@ -295,7 +326,7 @@ elif page == "銷售分析":
             for item in order['商品']:
                 sales_data.append({
                     '日期': order_date,
-                    '商品名稱': item['商品名稱'],
+                    '商品名稱': catalog.item_name(item),
                     '銷量': item['數量'],
                     '銷售額': item['小計'],
                     '取貨地點': order['取貨地點']
@@ -682,7 +713,7 @@ elif page == "備貨清單":
                 total_products_demand = {}
                 for _, order in pickup_orders.iterrows():
                     for item in order['商品']:
-                        product_name = item['商品名稱']
+                        product_name = catalog.item_name(item)
                         quantity = item['數量']
                         if product_name not in total_products_demand:
                             total_products_demand[product_name] = 0
@@ -756,7 +787,7 @@ elif page == "備貨清單":
                                 <div class="order-items">
                                     <p><strong>訂購商品：</strong></p>
                                     <ul style="list-style-type: none; padding-left: 0; margin: 5px 0;">
-                                        {"".join(f'<li>• {item["商品名稱"]} × <strong>{item["數量"]}</strong></li>' for item in order['商品'])}
+                                        {"".join(f'<li>• {catalog.item_name(item)} × <strong>{item["數量"]}</strong></li>' for item in order['商品'])}
                                     </ul>
                                 </div>
                             </div>
@@ -782,7 +813,7 @@ elif page == "備貨清單":
                             location_products = {}
                             for _, order in location_orders.iterrows():
                                 for item in order['商品']:
-                                    product_name = item['商品名稱']
+                                    product_name = catalog.item_name(item)
                                     quantity = item['數量']
                                     if product_name not in location_products:
                                         location_products[product_name] = 0
@@ -803,7 +834,7 @@ elif page == "備貨清單":
                                         '客戶名稱': order['客戶名稱'],
                                         '訂單號': order['訂單號'],
                                         '電話': order['電話'],
-                                        '商品名稱': item['商品名稱'],
+                                        '商品名稱': catalog.item_name(item),
                                         '數量': item['數量']
                                     })
                             orders_df = pd.DataFrame(orders_data)
@@ -1,9 +1,16 @@
 import streamlit as st
 from streamlit_card import card
 import pandas as pd
-import json
+import functools
+import math
+import os
 from datetime import datetime
 
+from catalog import Catalog
+from datastore import OutOfStock, commit_stock
+from order_id import new_order_id
+from order_journal import OrderJournal
+
 # 設置頁面配置
 st.set_page_config(
     page_title="海鮮冷藏專賣店",
@@ -11,111 +18,68 @@ st.set_page_config(
     layout="wide"
 )
 
-# 商品數據
-products = [
-    {
-        "類別": "鮮魚",
-        "名稱": "挪威鮭魚切片",
-        "規格": "300g/包",
-        "價格": 299,
-        "庫存": 50,
-        "圖片": "https://images.unsplash.com/photo-1485921325833-c519f76c4927",
-        "描述": "新鮮空運進口，油脂豐富"
-    },
-    {
-        "類別": "鮮魚",
-        "名稱": "黑鮪魚生魚片",
-        "規格": "200g/盒",
-        "價格": 599,
-        "庫存": 25,
-        "圖片": "https://images.unsplash.com/photo-1579712267685-42da80f60aa4",
-        "描述": "頂級黑鮪魚，油脂豐富"
-    },
-    {
-        "類別": "蝦類",
-        "名稱": "活凍草蝦",
-        "規格": "600g/盒",
-        "價格": 399,
-        "庫存": 40,
-        "圖片": "https://images.unsplash.com/photo-1565680018434-b583b12be0d3",
-        "描述": "現撈急凍，保持鮮甜"
-    },
-    {
-        "類別": "蝦類",
-        "名稱": "大明蝦",
-        "規格": "400g/盒",
-        "價格": 499,
-        "庫存": 30,
-        "圖片": "https://images.unsplash.com/photo-1565980928632-3db8f418e5e4",
-        "描述": "肉質鮮美，口感彈牙"
-    },
-    {
-        "類別": "螃蟹",
-        "名稱": "活凍大沙母蟹",
-        "規格": "600g±50g/隻",
-        "價格": 899,
-        "庫存": 20,
-        "圖片": "https://images.unsplash.com/photo-1550747545-c896b5f89ff7",
-        "描述": "肉質鮮美，膏黃豐富"
-    },
-    {
-        "類別": "螃蟹",
-        "名稱": "萬里蟹",
-        "規格": "400g±50g/隻",
-        "價格": 699,
-        "庫存": 15,
-        "圖片": "https://images.unsplash.com/photo-1550747528-cdb45925b3f7",
-        "描述": "在地特產，新鮮直送"
-    },
-    {
-        "類別": "貝類",
-        "名稱": "生食級大干貝",
-        "規格": "10顆/盒",
-        "價格": 699,
-        "庫存": 30,
-        "圖片": "https://images.unsplash.com/photo-1565680018434-b583b12be0d3",
-        "描述": "日本北海道進口，鮮甜可口"
-    },
-    {
-        "類別": "貝類",
-        "名稱": "活凍白蛤蜊",
-        "規格": "500g/包",
-        "價格": 199,
-        "庫存": 45,
-        "圖片": "https://images.unsplash.com/photo-1565980928-261fd63e46f4",
-        "描述": "新鮮活凍，保持原味"
-    }
-]
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+PRODUCTS_PATH = os.path.join(DATA_DIR, 'products.json')
+
+# 每頁顯示的商品數
+PAGE_SIZE = 12
+
+# 可獨立重跑的片段：Streamlit 1.37 起為 st.fragment，1.33 起為 st.experimental_fragment，
+# 更舊的版本沒有片段，每次操作整頁重跑
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+if fragment is None:
+    def fragment(func=None, **kwargs):
+        return func if func is not None else (lambda func: func)
+
+# 商品目錄（每個進程共用一份，後台修改商品檔後數秒內生效）
+@st.cache_resource
+def get_catalog():
+    return Catalog(PRODUCTS_PATH)
+
+# 商品數據（本次 rerun 使用的唯讀快照）
+products = get_catalog().snapshot()
 
-# 初始化購物車
+# 初始化購物車（商品編號 → 數量）；cart_version 在購物車每次改變時加一
 if 'cart' not in st.session_state:
     st.session_state.cart = {}
+    st.session_state.cart_version = 0
 
-# 讀取訂單數據
-try:
-    with open('data/orders.json', 'r', encoding='utf-8') as f:
-        orders = json.load(f)
-except:
-    orders = []
+# 訂單日誌（每個進程共用一份，所有 session 一起使用）
+# 前台只附加新訂單，不載入既有訂單；壓縮由後台進程執行，結帳不會被壓縮拖慢
+@st.cache_resource
+def get_order_journal():
+    return OrderJournal(DATA_DIR, load=False, compact_interval=0)
+
+order_journal = get_order_journal()
 
 # 生成訂單號
 def generate_order_id():
-    return datetime.now().strftime('ORD%Y%m%d%H%M%S')
+    return new_order_id()
 
-# 保存訂單
+# 保存訂單（附加一行到訂單日誌）
 def save_order(order):
-    orders.append(order)
-    with open('data/orders.json', 'w', encoding='utf-8') as f:
-        json.dump(orders, f, ensure_ascii=False, indent=2)
+    order_journal.append(order)
+
+# 更新商品庫存（整張訂單一次扣除、只寫一次檔案；任何一項不足時拋出 OutOfStock，不扣除）
+def update_product_stock(order_items):
+    decrements = {}
+    for item in order_items:
+        decrements[item["商品編號"]] = decrements.get(item["商品編號"], 0) + item["數量"]
+    try:
+        commit_stock(PRODUCTS_PATH, decrements)
+    finally:
+        get_catalog().invalidate()
 
-# 更新商品庫存
-def update_product_stock(product_name, quantity):
-    for product in products:
-        if product["名稱"] == product_name:
-            product["庫存"] -= quantity
-            break
-    with open('data/products.json', 'w', encoding='utf-8') as f:
-        json.dump(products, f, ensure_ascii=False, indent=2)
+# 商品卡片文字（依商品內容快取，商品沒有修改時不重新產生）
+@functools.lru_cache(maxsize=8192)
+def card_text(description, spec, stock, price):
+    stock_text = f"{stock} 件" if stock > 0 else "售完"
+    return f"""
+                    {description}
+                    規格：{spec}
+                    庫存：{stock_text}
+                    價格：NT$ {price}
+                    """
 
 # 自定義CSS
 st.markdown("""
@@ -160,8 +124,30 @@ st.markdown("""
 st.title("🐟 海鮮冷藏專賣店")
 st.markdown("### 新鮮直送到府 | 冷藏配送 | 品質保證")
 
-# 顯示購物車
-with st.sidebar:
+# 從購物車移除商品
+def remove_from_cart(sku):
+    st.session_state.cart.pop(sku, None)
+    st.session_state.cart_version += 1
+
+# 購物車摘要（件數、商品總計）
+def cart_summary(products):
+    count = 0
+    total = 0
+    for sku, quantity in st.session_state.cart.items():
+        product_info = products.get(sku)
+        if product_info:
+            count += quantity
+            total += product_info["價格"] * quantity
+    return count, total
+
+# 顯示購物車（獨立重跑的片段：移除商品、填寫結帳表單只重跑購物車，結帳成功後整頁重跑）
+# 商品頁加入購物車只重跑該商品的片段，側邊欄要到下一次重跑才會更新；
+# 結帳時若購物車在上次顯示後改變過，先顯示最新內容請顧客確認，不直接下單
+@fragment
+def cart_sidebar():
+    products = get_catalog().snapshot()
+    shown_version = st.session_state.get("cart_shown_version")
+    st.session_state.cart_shown_version = st.session_state.cart_version
     st.header("🛒 購物車")
     if not st.session_state.cart:
         st.info("購物車是空的")
@@ -169,13 +155,15 @@ with st.sidebar:
         total = 0
         order_items = []  # 用於記錄訂單項目
         
-        for item, quantity in st.session_state.cart.items():
-            product_info = next((p for p in products if p["名稱"] == item), None)
+        for sku, quantity in st.session_state.cart.items():
+            product_info = products.get(sku)
             
             if product_info:
+                item = product_info["名稱"]
                 subtotal = product_info["價格"] * quantity
                 total += subtotal
                 order_items.append({
+                    "商品編號": sku,
                     "商品名稱": item,
                     "單價": product_info["價格"],
                     "數量": quantity,
@@ -188,9 +176,7 @@ with st.sidebar:
                     小計: NT$ {subtotal}
                 """)
                 
-                if st.button(f"❌ 移除 {item}", key=f"del_{item}"):
-                    del st.session_state.cart[item]
-                    st.rerun()
+                st.button(f"❌ 移除 {item}", key=f"del_{sku}", on_click=remove_from_cart, args=(sku,))
                 st.markdown("---")
         
         st.markdown(f"### 商品總計: NT$ {total}")
@@ -235,7 +221,9 @@ with st.sidebar:
                 address = ""
             
             if st.form_submit_button("💳 確認結帳"):
-                if not (customer_name and phone and (address or pickup_location)):
+                if shown_version != st.session_state.cart_version:
+                    st.warning("購物車內容已更新，請確認上方的商品與金額後再按一次確認結帳")
+                elif not (customer_name and phone and (address or pickup_location)):
                     st.error("請填寫完整的訂購資料")
                 else:
                     # 創建訂單
@@ -253,61 +241,106 @@ with st.sidebar:
                         "狀態": "待處理"
                     }
                     
-                    # 更新庫存
-                    for item in order_items:
-                        update_product_stock(item["商品名稱"], item["數量"])
-                    
-                    # 保存訂單
-                    save_order(order)
-                    
-                    # 清空購物車
-                    st.session_state.cart = {}
-                    st.success("訂單已送出！我們會盡快為您出貨！")
-                    st.rerun()
+                    # 更新庫存（庫存不足時不建立訂單）
+                    try:
+                        update_product_stock(order_items)
+                    except OutOfStock as e:
+                        names = [
+                            f"{item['商品名稱']}（剩 {e.shortages[item['商品編號']]} 件）"
+                            for item in order_items
+                            if item["商品編號"] in e.shortages
+                        ]
+                        st.error(f"以下商品庫存不足，請調整數量後再結帳：{'、'.join(names)}")
+                    else:
+                        # 保存訂單
+                        save_order(order)
+                        
+                        # 清空購物車
+                        st.session_state.cart = {}
+                        st.session_state.cart_version += 1
+                        st.success("訂單已送出！我們會盡快為您出貨！")
+                        # 庫存已改變，整頁重跑
+                        st.rerun()
+
+with st.sidebar:
+    cart_sidebar()
+
+# 加入購物車
+def add_to_cart(sku):
+    quantity = st.session_state[f"qty_{sku}"]
+    st.session_state.cart[sku] = st.session_state.cart.get(sku, 0) + quantity
+    st.session_state.cart_version += 1
+    st.session_state.last_added = sku
 
-# 商品分類選擇
-categories = ["全部"] + sorted(list(set(p["類別"] for p in products)))
-selected_category = st.selectbox("選擇商品類別", categories, index=0)
+# 加入購物車區域（獨立重跑的片段：點擊只重跑這一項商品，不重跑整頁）
+# 側邊欄不在片段內，加入後在這裡顯示購物車摘要
+@fragment
+def add_to_cart_controls(product):
+    # 售完的商品不顯示數量與加入按鈕（number_input 的 max_value 不能小於 min_value）
+    if product["庫存"] < 1:
+        st.button("售完", key=f"add_{product['編號']}", disabled=True)
+        return
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        st.number_input(
+            "購買數量",
+            min_value=1,
+            max_value=product["庫存"],
+            value=1,
+            key=f"qty_{product['編號']}"
+        )
+    with col2:
+        st.button("🛒 加入購物車", key=f"add_{product['編號']}", on_click=add_to_cart, args=(product["編號"],))
+    if st.session_state.get("last_added") == product["編號"]:
+        del st.session_state.last_added
+        count, total = cart_summary(get_catalog().snapshot())
+        st.success(f"已加入購物車！購物車共 {count} 件，商品總計 NT$ {total}")
 
-# 商品展示
-filtered_products = products if selected_category == "全部" else [p for p in products if p["類別"] == selected_category]
+# 商品分類選擇（切換類別時回到第一頁）
+def reset_product_page():
+    st.session_state.product_page = 1
+
+def set_product_page(number):
+    st.session_state.product_page = number
+
+if 'product_page' not in st.session_state:
+    st.session_state.product_page = 1
+
+categories = ["全部"] + list(products.categories)
+selected_category = st.selectbox("選擇商品類別", categories, index=0, on_change=reset_product_page)
+
+# 商品展示（只渲染目前這一頁）
+filtered_products = products.in_category(None if selected_category == "全部" else selected_category)
+total_pages = max(1, math.ceil(len(filtered_products) / PAGE_SIZE))
+page = min(st.session_state.product_page, total_pages)
+page_products = filtered_products[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
 
 st.markdown('<div style="height: 0.5rem"></div>', unsafe_allow_html=True)
 
-for i in range(0, len(filtered_products), 2):
+for i in range(0, len(page_products), 2):
     cols = st.columns([1, 1])
     for j in range(2):
-        if i + j < len(filtered_products):
-            product = filtered_products[i + j]
+        if i + j < len(page_products):
+            product = page_products[i + j]
             with cols[j]:
                 # 使用streamlit-card顯示商品
                 has_clicked = card(
                     title=product["名稱"],
-                    text=f"""
-                    {product['描述']}
-                    規格：{product['規格']}
-                    庫存：{product['庫存']} 件
-                    價格：NT$ {product['價格']}
-                    """,
+                    text=card_text(product['描述'], product['規格'], product['庫存'], product['價格']),
                     image=product["圖片"],
-                    key=f"card_{product['名稱']}"
+                    key=f"card_{product['編號']}"
                 )
                 
                 # 加入購物車區域
-                col1, col2 = st.columns([1, 1])
-                with col1:
-                    quantity = st.number_input(
-                        "購買數量",
-                        min_value=1,
-                        max_value=product["庫存"],
-                        value=1,
-                        key=f"qty_{product['名稱']}"
-                    )
-                with col2:
-                    if st.button("🛒 加入購物車", key=f"add_{product['名稱']}"):
-                        if product["名稱"] in st.session_state.cart:
-                            st.session_state.cart[product["名稱"]] += quantity
-                        else:
-                            st.session_state.cart[product["名稱"]] = quantity
-                        st.success("已加入購物車！")
+                add_to_cart_controls(product)
                 st.markdown("---")
+
+# 分頁
+if total_pages > 1:
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        st.button("◀ 上一頁", disabled=page <= 1, on_click=set_product_page, args=(page - 1,))
+    with col2:
+        st.markdown(f"<div style='text-align: center'>第 {page} / {total_pages} 頁（共 {len(filtered_products)} 項商品）</div>", unsafe_allow_html=True)
+    with col3:
+        st.button("下一頁 ▶", disabled=page >= total_pages, on_click=set_product_page, args=(page + 1,))
@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+from types import MappingProxyType
+
+from datastore import read_json
+
+# 兩次檢查商品檔之間至少間隔的秒數
+CHECK_INTERVAL = 2.0
+
+# 商品編號（SKU）：建立後不再改變，改名不影響訂單紀錄
+SKU_PREFIX = "SKU"
+
+
+def format_sku(number):
+    return f"{SKU_PREFIX}{number:04d}"
+
+
+# 下一個可用的商品編號
+def next_sku(products):
+    numbers = [
+        int(product["編號"][len(SKU_PREFIX):])
+        for product in products
+        if str(product.get("編號", "")).startswith(SKU_PREFIX) and product["編號"][len(SKU_PREFIX):].isdigit()
+    ]
+    return format_sku(max(numbers, default=0) + 1)
+
+
+# 為沒有編號的商品補上編號（依列表順序），返回是否有修改
+def assign_skus(products):
+    changed = False
+    for product in products:
+        if not product.get("編號"):
+            product["編號"] = next_sku(products)
+            changed = True
+    return changed
+
+
+# 某一版商品檔的唯讀快照，所有 session 共用同一份
+class CatalogSnapshot:
+    __slots__ = ("version", "products", "by_sku", "by_category", "categories")
+
+    def __init__(self, version, products):
+        self.version = version
+        self.products = tuple(MappingProxyType(product) for product in products)
+        self.by_sku = MappingProxyType({product.get("編號"): product for product in self.products})
+
+        # 類別索引：類別 → 該類別的商品（保持商品檔中的順序）
+        by_category = {}
+        for product in self.products:
+            by_category.setdefault(product.get("類別"), []).append(product)
+        self.by_category = MappingProxyType({name: tuple(items) for name, items in by_category.items()})
+        self.categories = tuple(sorted(name for name in by_category if name))
+
+    def __len__(self):
+        return len(self.products)
+
+    def __iter__(self):
+        return iter(self.products)
+
+    def get(self, sku):
+        return self.by_sku.get(sku)
+
+    # 某個類別的商品，category 為 None 時返回全部商品
+    def in_category(self, category=None):
+        if category is None:
+            return self.products
+        return self.by_category.get(category, ())
+
+    # 訂單明細的商品名稱：以編號查目前的名稱，商品已刪除時用下單時的名稱
+    def item_name(self, item):
+        product = self.by_sku.get(item.get("商品編號"))
+        return product["名稱"] if product is not None else item["商品名稱"]
+
+    # 可修改的複本（例如後台編輯用）
+    def copy(self):
+        return [dict(product) for product in self.products]
+
+
+# 商品目錄：整個進程只解析一次 products.json
+#
+# 每隔 check_interval 秒最多 stat 一次檔案，修改時間或大小改變才重新解析，
+# 其餘時候直接返回同一份快照，rerun 不會重複讀取 JSON。
+# 快照的版本號與 datastore.read_json 相同（內容雜湊），後台寫回時用來判斷是否需要合併。
+# 商品檔以原子替換寫入（見 datastore.atomic_write_json），不會讀到寫到一半的檔案。
+class Catalog:
+    def __init__(self, path, check_interval=CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = CatalogSnapshot(None, [])
+        self._stat = None
+        self._checked_at = None
+
+    def snapshot(self):
+        if self._fresh():
+            return self._snapshot
+        with self._lock:
+            # 其他執行緒可能剛檢查過
+            if not self._fresh():
+                self._revalidate()
+                self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def _fresh(self):
+        checked_at = self._checked_at
+        return checked_at is not None and time.monotonic() - checked_at < self.check_interval
+
+    # 本進程剛寫入商品檔時呼叫，下次取得快照時立即重新檢查
+    def invalidate(self):
+        with self._lock:
+            self._checked_at = None
+
+    def _revalidate(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._stat = None
+            if self._snapshot.version is not None:
+                self._snapshot = CatalogSnapshot(None, [])
+            return
+        signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if signature == self._stat:
+            return
+        try:
+            products, version = read_json(self.path)
+        except Exception as e:
+            # 保留上一份快照，下次檢查時再試
+            print(f"載入商品數據時出錯: {str(e)}")
+            return
+        self._stat = signature
+        if version != self._snapshot.version:
+            self._snapshot = CatalogSnapshot(version, products)
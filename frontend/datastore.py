@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，只能保證同一個進程內不互相干擾
+    fcntl = None
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+# 每個檔案一把鎖：同一進程內的 session 用 threading.Lock，跨進程用 flock（鎖檔為 path + ".lock"）
+#
+# shared=True 時跨進程為共享鎖，多個進程的讀取者可同時持有（同一進程內仍依序執行）。
+# blocking=False 時拿不到鎖立即返回，with 取得的值表示是否拿到鎖。
+# 不可重入：持有鎖時不能再取得同一個檔案的鎖。
+@contextmanager
+def file_lock(path, shared=False, blocking=True):
+    with _locks_guard:
+        lock = _locks.setdefault(os.path.abspath(path), threading.Lock())
+    if not lock.acquire(blocking):
+        yield False
+        return
+    try:
+        if fcntl is None:
+            yield True
+            return
+        with open(path + ".lock", "a") as lock_file:
+            flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+            try:
+                fcntl.flock(lock_file, flags if blocking else flags | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    finally:
+        lock.release()
+
+
+# 先寫入同目錄的暫存檔並 fsync，再原子替換，讀取者只會看到完整的舊檔或新檔
+# 返回新內容的版本號
+def atomic_write_json(path, data):
+    raw = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return content_version(raw)
+
+
+# 檔案內容的版本號（內容雜湊），內容相同的檔案版本相同
+def content_version(raw):
+    return hashlib.sha1(raw).hexdigest()
+
+
+# 讀取 JSON 檔，返回 (資料, 版本號)；檔案不存在時返回 (default, None)
+def read_json(path, default=None):
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return default, None
+    return json.loads(raw), content_version(raw)
+
+
+# 在鎖內讀取最新內容、以 func(資料, 版本號) 產生新內容並原子替換
+#
+# 所有寫入者（前台各個副本、後台）都經過這裡，讀取與寫入之間不會有其他寫入插進來。
+# 返回 (新資料, 新版本號)。
+def update_json(path, func, default=None):
+    with file_lock(path):
+        data, version = read_json(path, default)
+        data = func(data, version)
+        version = atomic_write_json(path, data)
+    return data, version
+
+
+# 三方合併記錄列表：base 為我方讀取時的版本，mine 為我方修改後的版本，theirs 為檔案目前的內容
+#
+# 以 key 對應記錄：我方改過的欄位用我方的值，其餘欄位保留對方的修改；
+# 雙方都改過 additive 中的數值欄位（例如後台調整庫存、前台同時扣除庫存）時兩邊的增減都保留，
+# 結果最小為 0（例如後台把庫存改得比期間已賣出的數量還少時）。
+# 我方刪除的記錄不再寫回，對方新增的記錄保留，我方新增的記錄接在最後。
+def merge_records(base, mine, theirs, key, additive=()):
+    base_index = {record.get(key): record for record in base}
+    mine_index = {record.get(key): record for record in mine}
+    merged = []
+    for record in theirs:
+        record_key = record.get(key)
+        if record_key not in mine_index:
+            if record_key not in base_index:
+                merged.append(record)
+            continue
+        merged.append(_merge_record(base_index.get(record_key), mine_index[record_key], record, additive))
+    theirs_keys = {record.get(key) for record in theirs}
+    for record in mine:
+        if record.get(key) not in theirs_keys and record.get(key) not in base_index:
+            merged.append(record)
+    return merged
+
+
+def _merge_record(base, mine, theirs, additive):
+    if base is None:
+        return dict(mine)
+    merged = dict(theirs)
+    for field, value in mine.items():
+        if field in base and base[field] == value:
+            continue
+        if field in additive and field in base and field in theirs:
+            merged[field] = theirs[field] + value - base[field]
+            if merged[field] < 0:
+                print(f"{field} 合併結果為 {merged[field]}（{base[field]} → 我方 {value}、對方 {theirs[field]}），改為 0")
+                merged[field] = 0
+        else:
+            merged[field] = value
+    return merged
+
+
+# 庫存不足：shortages 為 {商品編號: 目前庫存}，商品已刪除時目前庫存為 0
+class OutOfStock(Exception):
+    def __init__(self, shortages):
+        super().__init__(f"庫存不足: {', '.join(shortages)}")
+        self.shortages = shortages
+
+
+# 一次扣除整張訂單的庫存：decrements 為 {商品編號: 數量}
+#
+# 在鎖內讀取最新的商品檔，先檢查每一項的庫存，全部足夠才一次套用所有扣減、只寫一次，
+# 同時結帳的 session 或副本不會互相覆蓋對方的扣減，也不會超賣。
+# 任何一項不足時不寫入檔案，拋出 OutOfStock。返回更新後的商品列表。
+def commit_stock(path, decrements):
+    with file_lock(path):
+        products, _ = read_json(path, [])
+        index = {product.get("編號"): product for product in products}
+        shortages = {}
+        for sku, quantity in decrements.items():
+            product = index.get(sku)
+            stock = product["庫存"] if product is not None else 0
+            if stock < quantity:
+                shortages[sku] = stock
+        if shortages:
+            raise OutOfStock(shortages)
+        for sku, quantity in decrements.items():
+            index[sku]["庫存"] -= quantity
+        atomic_write_json(path, products)
+    return products
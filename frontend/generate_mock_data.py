@@ -1,3 +1,4 @@
+import glob
 import json
 import random
 from datetime import datetime, timedelta
@@ -10,6 +11,7 @@ if not os.path.exists('data'):
 # 商品數據
 products = [
     {
+        "編號": "SKU0001",
         "類別": "鮮魚",
         "名稱": "挪威鮭魚切片",
         "規格": "300g/包",
@@ -19,6 +21,7 @@ products = [
         "描述": "新鮮空運進口，油脂豐富"
     },
     {
+        "編號": "SKU0002",
         "類別": "鮮魚",
         "名稱": "黑鮪魚生魚片",
         "規格": "200g/盒",
@@ -28,6 +31,7 @@ products = [
         "描述": "頂級黑鮪魚，油脂豐富"
     },
     {
+        "編號": "SKU0003",
         "類別": "蝦類",
         "名稱": "活凍草蝦",
         "規格": "600g/盒",
@@ -37,6 +41,7 @@ products = [
         "描述": "現撈急凍，保持鮮甜"
     },
     {
+        "編號": "SKU0004",
         "類別": "蝦類",
         "名稱": "大明蝦",
         "規格": "400g/盒",
@@ -46,6 +51,7 @@ products = [
         "描述": "肉質鮮美，口感彈牙"
     },
     {
+        "編號": "SKU0005",
         "類別": "螃蟹",
         "名稱": "活凍大沙母蟹",
         "規格": "600g±50g/隻",
@@ -55,6 +61,7 @@ products = [
         "描述": "肉質鮮美，膏黃豐富"
     },
     {
+        "編號": "SKU0006",
         "類別": "螃蟹",
         "名稱": "萬里蟹",
         "規格": "400g±50g/隻",
@@ -64,6 +71,7 @@ products = [
         "描述": "在地特產，新鮮直送"
     },
     {
+        "編號": "SKU0007",
         "類別": "貝類",
         "名稱": "生食級大干貝",
         "規格": "10顆/盒",
@@ -73,6 +81,7 @@ products = [
         "描述": "日本北海道進口，鮮甜可口"
     },
     {
+        "編號": "SKU0008",
         "類別": "貝類",
         "名稱": "活凍白蛤蜊",
         "規格": "500g/包",
@@ -139,6 +148,7 @@ for i in range(600):
         total += subtotal
         
         order_items.append({
+            "商品編號": product["編號"],
             "商品名稱": product["名稱"],
             "單價": product["價格"],
             "數量": quantity,
@@ -173,4 +183,8 @@ with open('data/products.json', 'w', encoding='utf-8') as f:
 with open('data/orders.json', 'w', encoding='utf-8') as f:
     json.dump(orders, f, ensure_ascii=False, indent=2)
 
+# 舊的訂單日誌屬於上一份快照，一併刪除
+for path in glob.glob(os.path.join('data', 'orders.journal.*')):
+    os.remove(path)
+
 print(f"已生成 {len(products)} 個商品和 {len(orders)} 個訂單的模擬數據")
@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+
+# Crockford Base32：去掉容易混淆的 I、L、O、U，字母順序與數值順序一致
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+PREFIX = "ORD"
+TIME_BITS = 50   # 毫秒時間戳，可用到西元 37000 年以後
+NODE_BITS = 40   # 每個進程隨機選一個節點編號
+SEQ_BITS = 40    # 同一毫秒內的流水號
+LENGTH = (TIME_BITS + NODE_BITS + SEQ_BITS) // 5
+
+
+def _encode(value, length):
+    chars = []
+    for _ in range(length):
+        chars.append(ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+# 訂單號產生器：ORD + 26 個 Base32 字元（毫秒時間戳、節點、流水號）
+#
+# 依字串排序即為時間順序，可直接當作依時間排序的索引鍵。
+# 同一進程內以鎖保證單調遞增：同一毫秒（或時鐘倒退）時沿用上一個時間戳並遞增流水號。
+# 不同進程（Streamlit 的各個 session 共用進程，app 與 admin 兩個容器各自一個）
+# 靠隨機的節點編號區分，不需要跨進程的鎖；fork 後子進程會重新選一個節點編號。
+class OrderIdGenerator:
+    def __init__(self, prefix=PREFIX, node=None, clock=time.time_ns):
+        self.prefix = prefix
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._node = node if node is not None else _random_node()
+        self._last_ms = 0
+        self._seq = 0
+
+    def __call__(self):
+        with self._lock:
+            now_ms = self.clock() // 1_000_000
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._seq = 0
+            else:
+                self._seq += 1
+                if self._seq >> SEQ_BITS:
+                    # 流水號用完，借用下一毫秒
+                    self._last_ms += 1
+                    self._seq = 0
+            value = (((self._last_ms << NODE_BITS) | self._node) << SEQ_BITS) | self._seq
+        return self.prefix + _encode(value, LENGTH)
+
+    def _reseed(self):
+        self._lock = threading.Lock()
+        self._node = _random_node()
+
+
+def _random_node():
+    return int.from_bytes(os.urandom(NODE_BITS // 8), "big")
+
+
+_generator = OrderIdGenerator()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_generator._reseed)
+
+
+# 產生新的訂單號
+def new_order_id():
+    return _generator()
@@ -0,0 +1,348 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+from datastore import atomic_write_json, file_lock
+
+# 日誌累積到這個大小（且至少為快照大小的 COMPACT_RATIO 倍）時，背景執行緒把它併入快照
+COMPACT_BYTES = 4 * 1024 * 1024
+COMPACT_RATIO = 0.25
+COMPACT_INTERVAL = 60
+
+
+def _fsync_dir(path):
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+# 截掉分段結尾寫到一半的行（寫入者在寫入途中崩潰），下一行才不會接在它後面（已持有分段鎖）
+def _truncate_partial(fd):
+    size = os.fstat(fd).st_size
+    if size == 0:
+        return
+    os.lseek(fd, size - 1, os.SEEK_SET)
+    if os.read(fd, 1) == b"\n":
+        return
+    end = size
+    while end > 0:
+        start = max(0, end - 4096)
+        os.lseek(fd, start, os.SEEK_SET)
+        chunk = os.read(fd, end - start)
+        newline = chunk.rfind(b"\n")
+        if newline >= 0:
+            end = start + newline + 1
+            break
+        end = start
+    if end != size:
+        print(f"截掉訂單日誌結尾不完整的 {size - end} 位元組")
+        os.ftruncate(fd, end)
+        os.fsync(fd)
+
+
+def _inode(path):
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+
+# 依序套用快照與日誌的訂單表（讀取者與壓縮共用同一套規則，結果一致）
+#
+# 訂單以訂單號為鍵。遇到重複的訂單號（例如舊版以秒為單位產生的訂單號）時不覆蓋，
+# 後出現的一筆改為「訂單號-2」「訂單號-3」…，依出現順序決定，每個進程改出的編號都相同，
+# 壓縮後寫回快照即固定下來。
+class _OrderTable:
+    def __init__(self):
+        self.orders = {}
+
+    def add(self, order):
+        order_id = order["訂單號"]
+        if order_id in self.orders:
+            suffix = 2
+            while f"{order_id}-{suffix}" in self.orders:
+                suffix += 1
+            print(f"訂單號重複：{order_id}，改為 {order_id}-{suffix}")
+            order = dict(order, 訂單號=f"{order_id}-{suffix}")
+        self.orders[order["訂單號"]] = order
+
+    def apply(self, entry):
+        if entry["op"] == "add":
+            self.add(entry["order"])
+        elif entry["op"] == "update":
+            order = self.orders.get(entry["訂單號"])
+            if order is not None:
+                order.update(entry["fields"])
+
+    def load_snapshot(self, f):
+        for order in json.load(f):
+            self.add(order)
+
+    # 從 offset 讀到最後一個完整的行，返回新的位移（寫到一半的行留到下次）
+    def apply_segment(self, path, offset=0):
+        try:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return offset
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # 寫到一半就中斷的行（舊版寫入者可能在它後面接著寫），略過
+                print(f"略過無法解析的訂單日誌行：{os.path.basename(path)}: {line[:80]!r}")
+                continue
+            self.apply(entry)
+        return offset + end
+
+
+# 訂單日誌：orders.json 為快照，新訂單與狀態變更以 JSONL 逐行附加到日誌分段
+#
+# 每次結帳只在目前的分段（orders.journal.000001.jsonl …）附加一行並 fsync，
+# 只持有分段鎖，成本與訂單總數無關。load=False 為只寫模式（前台），不載入任何訂單。
+# load=True（後台）載入快照再重播分段，之後只讀取新增的部分。
+#
+# 壓縮分兩步，結帳不會等待 O(N) 的寫入：
+# 1. 在分段鎖內開一個新分段（只建立空檔），之前的分段從此不再寫入
+# 2. 不持有分段鎖，把快照與已封存的分段合併寫入暫存檔；最後在快照鎖內原子替換快照並刪除已合併的分段
+# 讀取者在快照鎖（共享）內讀取快照與分段，看到的快照與分段一定一致，每一行只會套用一次。
+# 替換快照前先寫入壓縮記錄，替換後中斷時，讀取者與下一次壓縮都會略過已合併的分段。
+class OrderJournal:
+    def __init__(self, data_dir, snapshot_name="orders.json", journal_name="orders.journal", load=True,
+                 compact_bytes=COMPACT_BYTES, compact_ratio=COMPACT_RATIO, compact_interval=COMPACT_INTERVAL):
+        self.data_dir = data_dir
+        self.snapshot_path = os.path.join(data_dir, snapshot_name)
+        self.journal_name = journal_name
+        self.compact_bytes = compact_bytes
+        self.compact_ratio = compact_ratio
+        self.compact_interval = compact_interval
+
+        # 分段鎖（附加、開新分段）與壓縮鎖（同一時間只有一個進程壓縮）；快照鎖以快照路徑為準
+        self._segment_lock = os.path.join(data_dir, journal_name)
+        self._compact_lock = os.path.join(data_dir, journal_name + ".compact")
+        self._intent_path = os.path.join(data_dir, journal_name + ".compact.json")
+        self._segment_pattern = re.compile(re.escape(journal_name) + r"\.(\d+)\.jsonl$")
+
+        os.makedirs(data_dir, exist_ok=True)
+        self._append_seq = None
+        self._append_fd = None
+
+        # 記憶體中的訂單由 _lock 保護（先取 _lock 再取檔案鎖）
+        self.loaded = load
+        self._lock = threading.RLock()
+        self._table = _OrderTable()
+        self._snapshot_ino = None
+        self._tail_seq = None
+        self._tail_offset = 0
+        if load:
+            self.refresh()
+
+        self._compactor = None
+        if compact_interval:
+            self._compactor = threading.Thread(target=self._compact_loop, daemon=True)
+            self._compactor.start()
+
+    def _segment_path(self, seq):
+        return os.path.join(self.data_dir, f"{self.journal_name}.{seq:06d}.jsonl")
+
+    def _segments(self):
+        seqs = []
+        for name in os.listdir(self.data_dir):
+            match = self._segment_pattern.match(name)
+            if match:
+                seqs.append(int(match.group(1)))
+        return sorted(seqs)
+
+    # 中斷的壓縮：快照已替換時返回已合併到哪個分段，否則返回 None
+    def _folded_through(self):
+        try:
+            with open(self._intent_path, "r", encoding="utf-8") as f:
+                intent = json.load(f)
+        except FileNotFoundError:
+            return None
+        if intent["snapshot_ino"] == _inode(self.snapshot_path):
+            return intent["folded_through"]
+        return None
+
+    # ---- 讀取（後台） ----
+
+    # 讀取其他進程（或其他 session）新增的訂單
+    def refresh(self):
+        if not self.loaded:
+            raise RuntimeError("OrderJournal was opened with load=False")
+        with self._lock, file_lock(self.snapshot_path, shared=True):
+            if _inode(self.snapshot_path) != self._snapshot_ino:
+                seqs = self._segments()
+                # 快照被其他進程壓縮過：正在讀的分段還在，代表被合併的分段都已完整讀過，不需重新載入
+                if self._tail_seq is None or not seqs or self._tail_seq < seqs[0]:
+                    self._load()
+                    return
+                self._snapshot_ino = _inode(self.snapshot_path)
+            self._read_segments()
+
+    def _load(self):
+        table = _OrderTable()
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                self._snapshot_ino = os.fstat(f.fileno()).st_ino
+                table.load_snapshot(f)
+        except FileNotFoundError:
+            self._snapshot_ino = None
+        self._table = table
+        self._tail_seq = self._folded_through()
+        self._tail_offset = None
+        self._read_segments()
+
+    # 從目前讀到的位置繼續讀，再讀之後新出現的分段
+    def _read_segments(self):
+        for seq in self._segments():
+            if self._tail_seq is not None and seq < self._tail_seq:
+                continue
+            if seq == self._tail_seq:
+                if self._tail_offset is None:
+                    continue
+                offset = self._tail_offset
+            else:
+                offset = 0
+            self._tail_offset = self._table.apply_segment(self._segment_path(seq), offset)
+            self._tail_seq = seq
+
+    # 全部訂單（依加入順序），呼叫前會先讀取新增的日誌
+    def orders(self):
+        self.refresh()
+        return list(self._table.orders.values())
+
+    def get(self, order_id):
+        self.refresh()
+        return self._table.orders.get(order_id)
+
+    def __len__(self):
+        if not self.loaded:
+            raise RuntimeError("OrderJournal was opened with load=False")
+        return len(self._table.orders)
+
+    # ---- 寫入 ----
+
+    def _append(self, entry):
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with file_lock(self._segment_lock):
+            fd = self._active_segment()
+            os.write(fd, line)
+            os.fsync(fd)
+        if self.loaded:
+            self.refresh()
+
+    # 目前的分段（已持有分段鎖）：其他進程開了新分段，或分段已被壓縮刪除時改寫最新的分段
+    def _active_segment(self):
+        if self._append_fd is not None:
+            if os.fstat(self._append_fd).st_nlink > 0 and not os.path.exists(self._segment_path(self._append_seq + 1)):
+                _truncate_partial(self._append_fd)
+                return self._append_fd
+            os.close(self._append_fd)
+            self._append_fd = None
+        seqs = self._segments()
+        self._append_seq = seqs[-1] if seqs else 1
+        path = self._segment_path(self._append_seq)
+        created = not os.path.exists(path)
+        self._append_fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        if created:
+            _fsync_dir(self.data_dir)
+        _truncate_partial(self._append_fd)
+        return self._append_fd
+
+    # 新增訂單（已寫入磁碟才返回）
+    def append(self, order):
+        self._append({"op": "add", "order": order})
+
+    # 更新訂單欄位，例如 update("ORD0001", {"狀態": "已出貨"})
+    def update(self, order_id, fields):
+        self._append({"op": "update", "訂單號": order_id, "fields": fields})
+
+    # ---- 壓縮 ----
+
+    # 把已封存的分段併入快照；其他進程正在壓縮或日誌還不夠大時不做事，返回是否有壓縮
+    def compact(self, force=False):
+        with file_lock(self._compact_lock, blocking=False) as acquired:
+            if not acquired:
+                return False
+            self._finish_interrupted()
+
+            seqs = self._segments()
+            journal_bytes = sum(os.path.getsize(self._segment_path(seq)) for seq in seqs)
+            snapshot_bytes = os.path.getsize(self.snapshot_path) if os.path.exists(self.snapshot_path) else 0
+            if not journal_bytes or (not force and journal_bytes < max(self.compact_bytes, snapshot_bytes * self.compact_ratio)):
+                return False
+
+            sealed = self._rotate()
+            table = _OrderTable()
+            try:
+                with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                    table.load_snapshot(f)
+            except FileNotFoundError:
+                pass
+            for seq in sealed:
+                table.apply_segment(self._segment_path(seq))
+
+            fd, temp_path = tempfile.mkstemp(dir=self.data_dir, prefix=os.path.basename(self.snapshot_path) + ".", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(list(table.orders.values()), f, ensure_ascii=False, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    snapshot_ino = os.fstat(f.fileno()).st_ino
+                atomic_write_json(self._intent_path, {"folded_through": sealed[-1], "snapshot_ino": snapshot_ino})
+                with file_lock(self.snapshot_path):
+                    os.replace(temp_path, self.snapshot_path)
+                    _fsync_dir(self.data_dir)
+                    self._drop_segments(sealed[-1])
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            return True
+
+    # 開一個新分段，返回之前的分段（之後不會再被寫入）
+    def _rotate(self):
+        with file_lock(self._segment_lock):
+            seqs = self._segments()
+            with open(self._segment_path(seqs[-1] + 1), "ab"):
+                pass
+            _fsync_dir(self.data_dir)
+        return seqs
+
+    # 刪除已合併的分段與壓縮記錄（已持有快照鎖）
+    def _drop_segments(self, folded_through):
+        for seq in self._segments():
+            if seq <= folded_through:
+                os.remove(self._segment_path(seq))
+        os.remove(self._intent_path)
+        _fsync_dir(self.data_dir)
+
+    # 完成上一次中斷的壓縮（已持有壓縮鎖）
+    def _finish_interrupted(self):
+        if not os.path.exists(self._intent_path):
+            return
+        with file_lock(self.snapshot_path):
+            folded_through = self._folded_through()
+            if folded_through is not None:
+                self._drop_segments(folded_through)
+            else:
+                os.remove(self._intent_path)
+
+    def _compact_loop(self):
+        while True:
+            time.sleep(self.compact_interval)
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"壓縮訂單日誌時出錯: {str(e)}")
@@ -6,6 +6,13 @@ import os
 # 設置頁面配置
 st.set_page_config(page_title="購物車清單", layout="wide")
 
+# 可獨立重跑的片段：Streamlit 1.37 起為 st.fragment，1.33 起為 st.experimental_fragment，
+# 更舊的版本沒有片段，每次操作整頁重跑
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+if fragment is None:
+    def fragment(func=None, **kwargs):
+        return func if func is not None else (lambda func: func)
+
 # 初始化數據庫
 def init_db():
     # 確保數據目錄存在
@@ -211,14 +218,17 @@ for idx, product in enumerate(products):
                 st.toast(f"已將 {product['name']} 加入購物車！", icon="✅")
         
 
-# 顯示購物車內容
-st.divider()
-st.subheader("📇購物車內容")
+# 顯示購物車內容（獨立重跑的片段：刪除、清空只重跑購物車，不重跑整頁）
+@fragment
+def cart_section():
+    st.divider()
+    st.subheader("📇購物車內容")
+
+    cart_items = get_cart_items()
+    if not cart_items:
+        st.info("購物車是空的，快去選購喜歡的商品吧！")
+        return
 
-cart_items = get_cart_items()
-if not cart_items:
-    st.info("購物車是空的，快去選購喜歡的商品吧！")
-else:
     # 計算總金額
     total = sum(price * quantity for _, _, price, quantity in cart_items)
     
@@ -228,14 +238,12 @@ else:
         with col1:
             st.write(f"{name} × {quantity} = NT$ {price * quantity}")
         with col2:
-            if st.button("刪除", key=f"remove_{product_id}"):
-                if remove_from_cart(product_id):
-                    st.rerun()
+            st.button("刪除", key=f"remove_{product_id}", on_click=remove_from_cart, args=(product_id,))
     
     st.divider()
     st.markdown(f"### 總金額: NT$ {total}")
     
     # 清空購物車按鈕
-    if st.button("清空購物車", type="primary"):
-        if clear_cart():
-            st.rerun()
+    st.button("清空購物車", type="primary", on_click=clear_cart)
+
+cart_section()
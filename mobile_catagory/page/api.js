@@ -42,11 +42,18 @@ async function getProductDetails(productId) {
     return await fetchAPI(`/products/${productId}`);
 }
 
+// 产品缩图网址（后端依浏览器支持返回WebP或JPEG）
+function getProductImageUrl(productId, width) {
+    return `${API_BASE_URL}/products/${productId}/image?w=${width}`;
+}
+
 // 提交订单
-async function submitOrder(orderData) {
+// idempotencyKey：同一次结账的重试使用相同的key，避免网络不稳时重复下单
+async function submitOrder(orderData, idempotencyKey) {
     return await fetchAPI('/orders', {
         method: 'POST',
-        body: JSON.stringify(orderData)
+        body: JSON.stringify(orderData),
+        headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {}
     });
 }
 
@@ -55,6 +62,35 @@ async function getOrderStatus(orderId) {
     return await fetchAPI(`/orders/${orderId}`);
 }
 
+// 订阅订单状态变化（SSE），每次状态改变时调用onStatus(status)，返回取消订阅的函数
+// 浏览器不支持EventSource时改为每10秒查询一次
+function watchOrderStatus(orderId, onStatus) {
+    if (typeof EventSource === 'undefined') {
+        let lastStatus = null;
+        const poll = async () => {
+            const order = await getOrderStatus(orderId).catch(() => null);
+            if (order && order.status !== lastStatus) {
+                lastStatus = order.status;
+                onStatus(order.status);
+            }
+        };
+        poll();
+        const timer = setInterval(poll, 10000);
+        return () => clearInterval(timer);
+    }
+
+    const source = new EventSource(`${API_BASE_URL}/orders/${orderId}/events`);
+    source.addEventListener('status', (event) => {
+        const { status } = JSON.parse(event.data);
+        onStatus(status);
+        // 终止状态后服务器会结束串流，不需要重连
+        if (['cancelled', 'failed', 'expired'].includes(status)) {
+            source.close();
+        }
+    });
+    return () => source.close();
+}
+
 // 用户登录
 async function login(credentials) {
     return await fetchAPI('/auth/login', {
@@ -76,8 +112,10 @@ export {
     getProducts,
     getProductsByCategory,
     getProductDetails,
+    getProductImageUrl,
     submitOrder,
     getOrderStatus,
+    watchOrderStatus,
     login,
     register
 };
@@ -0,0 +1,83 @@
+"""序列化基准测试：比较标准库json与orjson（FAST_JSON）每个请求的CPU耗时
+
+    python bench_serialization.py --iterations 20000
+"""
+import argparse
+import json
+import time
+
+import orjson
+
+from main import Order, Product, catalog, order_to_dict
+
+ORDER = {
+    "items": [
+        {"productId": 1, "name": "紐西蘭牛排", "price": 499, "quantity": 2, "onSale": True, "originalPrice": 599},
+        {"productId": 4, "name": "急凍生蝦", "price": 399, "quantity": 1},
+        {"productId": 9, "name": "扇貝", "price": 459, "quantity": 3},
+    ],
+    "total": 2774,
+    "customerName": "王小明",
+    "phone": "0912345678",
+    "email": "test@example.com",
+    "address": "台北市中正區測試路1號",
+    "paymentMethod": "cash",
+    "notes": "請於下午送達",
+    "orderDate": "2025-02-23T10:00:00",
+}
+
+
+def std_dumps(content) -> bytes:
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+CODECS = {
+    "json": (json.loads, std_dumps),
+    "orjson": (orjson.loads, orjson.dumps),
+}
+
+
+# 下单：解析请求体 -> 验证 -> 存储编码 -> 响应编码
+def checkout(loads, dumps, body: bytes) -> None:
+    order = Order.parse_obj(loads(body))
+    record = order_to_dict(order)
+    record.update(id="00000000-0000-0000-0000-000000000000", status="pending", createdAt="2025-02-23T10:00:00")
+    dumps(record)
+    dumps({"message": "Order created successfully", "orderId": record["id"], "status": "pending"})
+
+
+# 查询订单：解码存储内容 -> 响应编码（旧路径）
+def get_order(loads, dumps, stored: bytes) -> None:
+    dumps(loads(stored))
+
+
+# 商品列表：模型验证 -> 编码（未命中缓存时）
+def list_products(loads, dumps, _) -> None:
+    dumps([Product(**p).dict() for p in catalog.all()])
+
+
+def measure(func, loads, dumps, payload, iterations: int) -> float:
+    start = time.process_time()
+    for _ in range(iterations):
+        func(loads, dumps, payload)
+    return (time.process_time() - start) / iterations * 1e6
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser(description="序列化基准测试")
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    body = std_dumps(ORDER)
+    stored = std_dumps(dict(ORDER, id="x", status="pending", createdAt="2025-02-23T10:00:00"))
+    cases = [("POST /orders", checkout, body), ("GET /orders/{id}", get_order, stored), ("GET /products", list_products, None)]
+
+    print(f"{'endpoint':<20}{'json (us)':>12}{'orjson (us)':>14}{'saved':>10}")
+    for name, func, payload in cases:
+        results = {codec: measure(func, *CODECS[codec], payload, args.iterations) for codec in CODECS}
+        saved = 1 - results["orjson"] / results["json"]
+        print(f"{name:<20}{results['json']:>12.1f}{results['orjson']:>14.1f}{saved:>9.0%}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,54 @@
+from typing import Dict, FrozenSet, List, Optional
+
+_EMPTY: List[dict] = []
+
+
+# 商品目录：启动时一次性建立索引，请求路径上只做字典查询
+class Catalog:
+    def __init__(self, products: List[dict]):
+        self.version = 0
+        self.load(products)
+
+    # 载入（或重新载入）商品并重建所有索引
+    def load(self, products: List[dict]) -> None:
+        products = list(products)
+        by_id: Dict[int, dict] = {}
+        by_category: Dict[str, List[dict]] = {}
+
+        for product in products:
+            by_id[product["id"]] = product
+            by_category.setdefault(product["category"], []).append(product)
+
+        self._products = products
+        self._by_id = by_id
+        self._by_category = by_category
+        self._on_sale = frozenset(p["id"] for p in products if p.get("onSale"))
+        self.version += 1
+
+    # 全部商品（共享列表，调用方不可修改）
+    def all(self) -> List[dict]:
+        return self._products
+
+    # 按ID获取商品，不存在时返回None
+    def get(self, product_id: int) -> Optional[dict]:
+        return self._by_id.get(product_id)
+
+    # 按类别获取商品，保持原始顺序；"all"返回全部商品
+    def by_category(self, category: str) -> List[dict]:
+        if category == "all":
+            return self._products
+        return self._by_category.get(category, _EMPTY)
+
+    def categories(self) -> List[str]:
+        return list(self._by_category)
+
+    # 特价商品ID集合
+    @property
+    def on_sale(self) -> FrozenSet[int]:
+        return self._on_sale
+
+    def __len__(self) -> int:
+        return len(self._products)
+
+    def __contains__(self, product_id: int) -> bool:
+        return product_id in self._by_id
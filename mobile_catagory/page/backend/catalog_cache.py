@@ -0,0 +1,62 @@
+import hashlib
+from typing import Callable, Dict, Optional, Tuple, Type, Union
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+from catalog import Catalog
+from serialization import dumps
+
+
+# 商品目录响应缓存：每个视图只做一次模型验证和JSON编码
+#
+# 缓存内容与商品目录的版本绑定，目录重新载入（version改变）时整体失效。
+# ETag为响应内容的哈希，客户端带If-None-Match时直接回304。
+class CatalogResponseCache:
+    def __init__(self, catalog: Catalog, model: Type[BaseModel], max_age: int = 60):
+        self.catalog = catalog
+        self.model = model
+        self.cache_control = f"public, max-age={max_age}"
+        self._version = catalog.version
+        self._entries: Dict[str, Tuple[bytes, str]] = {}
+
+    def _get(self, key: str, build: Callable[[], Union[dict, list]]) -> Tuple[bytes, str]:
+        if self._version != self.catalog.version:
+            self._entries = {}
+            self._version = self.catalog.version
+
+        entry = self._entries.get(key)
+        if entry is None:
+            content = build()
+            if isinstance(content, list):
+                content = [self.model(**item).dict() for item in content]
+            else:
+                content = self.model(**content).dict()
+            body = dumps(content)
+            etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+            entry = (body, etag)
+            self._entries[key] = entry
+        return entry
+
+    # 返回缓存的响应，ETag匹配时返回304
+    def respond(self, request: Request, key: str, build: Callable[[], Union[dict, list]]) -> Response:
+        body, etag = self._get(key, build)
+        headers = {"ETag": etag, "Cache-Control": self.cache_control}
+
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
@@ -0,0 +1,99 @@
+import asyncio
+import itertools
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+
+from serialization import dumps
+
+# 订阅全部订单事件的主题
+ALL = "*"
+
+
+class Subscription:
+    __slots__ = ("topic", "queue")
+
+    def __init__(self, topic: str, queue_size: int):
+        self.topic = topic
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+
+# 进程内的发布/订阅：每个订阅只是一个小队列，闲置的连接只占一个等待中的协程
+#
+# 发布不会等待：订阅者的队列满了（客户端读得太慢）就丢掉最旧的事件，
+# 事件只是状态通知，客户端收到最新状态即可。
+# 每个worker各自发布，只会收到同一个worker中发生的状态变化。
+class EventBroker:
+    def __init__(self, queue_size: int = 32):
+        self.queue_size = queue_size
+        self._topics: Dict[str, Set[Subscription]] = {}
+        self._ids = itertools.count(1)
+
+    def subscribe(self, topic: str) -> Subscription:
+        subscription = Subscription(topic, self.queue_size)
+        self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._topics.get(subscription.topic)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._topics[subscription.topic]
+
+    # 发布给该主题与ALL的订阅者，返回事件ID
+    def publish(self, topic: str, event: dict) -> int:
+        event_id = next(self._ids)
+        message = (event_id, event)
+        for name in (topic, ALL):
+            for subscription in self._topics.get(name, ()):
+                queue = subscription.queue
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(message)
+        return event_id
+
+    def __len__(self) -> int:
+        return sum(len(subscribers) for subscribers in self._topics.values())
+
+
+def format_event(event: dict, event_id: Optional[int] = None, name: str = "status") -> bytes:
+    lines = []
+    if event_id is not None:
+        lines.append(b"id: %d" % event_id)
+    lines.append(b"event: " + name.encode("utf-8"))
+    lines.append(b"data: " + dumps(event))
+    return b"\n".join(lines) + b"\n\n"
+
+
+# Server-Sent Events串流：先订阅，再送出snapshot()取得的目前状态，之后转送订阅到的事件
+#
+# 先订阅再读取目前状态，两者之间发生的变化不会漏掉。
+# 每keepalive秒没有事件时送出注释行，避免代理或浏览器因闲置断线；
+# until对事件返回True时结束串流（例如订单进入终止状态）。
+async def stream(
+    broker: EventBroker,
+    topic: str,
+    snapshot: Optional[Callable[[], Awaitable[Optional[dict]]]] = None,
+    keepalive: float = 15,
+    until: Optional[Callable[[dict], bool]] = None,
+) -> AsyncIterator[bytes]:
+    subscription = broker.subscribe(topic)
+    try:
+        # 告诉浏览器断线后多久重连（毫秒）
+        yield b"retry: 3000\n\n"
+        if snapshot is not None:
+            initial = await snapshot()
+            if initial is not None:
+                yield format_event(initial)
+                if until is not None and until(initial):
+                    return
+        while True:
+            try:
+                event_id, event = await asyncio.wait_for(subscription.queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            yield format_event(event, event_id)
+            if until is not None and until(event):
+                return
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,34 @@
+"""下载商品来源图片到本地，之后缩图服务可离线运行
+
+    python fetch_images.py --output images
+"""
+import argparse
+import os
+import urllib.request
+
+from main import products
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser(description="下载商品来源图片")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "images"))
+    parser.add_argument("--force", action="store_true", help="已存在的图片也重新下载")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    for product in products:
+        path = os.path.join(args.output, f"{product['id']}.jpg")
+        if os.path.exists(path) and not args.force:
+            continue
+        # 去掉Unsplash的缩放参数，下载原图
+        url = product["image"].split("?")[0]
+        with urllib.request.urlopen(url, timeout=30) as response:
+            data = response.read()
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+        print(f"{product['id']}: {product['name']} ({len(data)} bytes)")
+
+
+if __name__ == "__main__":
+    run()
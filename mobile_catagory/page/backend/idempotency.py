@@ -0,0 +1,299 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Sequence
+
+from metrics import ROUTE_LABEL
+from order_store import OrderStore
+
+MAX_KEY_LENGTH = 255
+
+# 路由从scope[IDEMPOTENCY_CLAIM]取得本次请求的IdempotencyClaim（没有带key时不存在）
+IDEMPOTENCY_CLAIM = "idempotency.claim"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    body BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_created ON idempotency_keys (created_at);
+"""
+
+INSERT_KEY_SQL = "INSERT INTO idempotency_keys (key, fingerprint, status, body, created_at) VALUES (?, ?, ?, ?, ?)"
+DELETE_EXPIRED_KEY_SQL = "DELETE FROM idempotency_keys WHERE key = ? AND created_at <= ?"
+PURGE_SQL = "DELETE FROM idempotency_keys WHERE created_at <= ?"
+SELECT_KEY_SQL = "SELECT fingerprint, status, body FROM idempotency_keys WHERE key = ? AND created_at > ?"
+# 每记录这么多个key清理一次过期的记录
+PURGE_EVERY = 1000
+
+
+# 有容量上限的TTL缓存：过期的项目在读取时删除，超过容量时淘汰最久未使用的项目
+class TTLCache:
+    def __init__(self, max_entries: int = 10000, ttl: float = 86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# 其他worker已用同一个key完成请求（本次的写入已回滚）
+class IdempotencyConflict(Exception):
+    def __init__(self, key: str):
+        super().__init__(f"Idempotency-Key {key!r} was already used")
+        self.key = key
+
+
+# 保存在订单数据库中的Idempotency-Key（所有worker共用）
+#
+# 路由在写入订单的同一个事务中记录key与响应（record_op），
+# 因此订单与key一起提交或一起回滚；同时到达不同worker的重送只有一个能写入，
+# 另一个得到IdempotencyConflict，改为返回先完成的那个响应。
+class IdempotencyStore:
+    def __init__(self, store: OrderStore, ttl: float = 86400):
+        self.store = store
+        self.ttl = ttl
+        self._recorded = 0
+
+    async def start(self) -> None:
+        def setup(conn: sqlite3.Connection) -> None:
+            for statement in SCHEMA.strip().split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+            conn.execute(PURGE_SQL, (time.time() - self.ttl,))
+
+        await self.store.transact(setup)
+
+    async def get(self, key: str) -> Optional["_Completed"]:
+        now = time.time()
+        row = await self.store.read(lambda conn: conn.execute(SELECT_KEY_SQL, (key, now - self.ttl)).fetchone())
+        if row is None:
+            return None
+        fingerprint, status, body = row
+        return _Completed(fingerprint, status, _json_headers(body), bytes(body))
+
+    # 返回记录key与响应的操作，在OrderStore.transact中执行；key已被使用时抛出IdempotencyConflict
+    def record_op(self, key: str, fingerprint: str, status: int, body: bytes) -> Callable[[sqlite3.Connection], None]:
+        now = time.time()
+        expired_before = now - self.ttl
+        self._recorded += 1
+        purge = self._recorded % PURGE_EVERY == 0
+
+        def op(conn: sqlite3.Connection) -> None:
+            if purge:
+                conn.execute(PURGE_SQL, (expired_before,))
+            else:
+                conn.execute(DELETE_EXPIRED_KEY_SQL, (key, expired_before))
+            try:
+                conn.execute(INSERT_KEY_SQL, (key, fingerprint, status, body, now))
+            except sqlite3.IntegrityError:
+                raise IdempotencyConflict(key) from None
+
+        return op
+
+
+# 本次请求的key：路由写入时用record_op记录响应
+class IdempotencyClaim:
+    __slots__ = ("store", "key", "fingerprint")
+
+    def __init__(self, store: IdempotencyStore, key: str, fingerprint: str):
+        self.store = store
+        self.key = key
+        self.fingerprint = fingerprint
+
+    def record_op(self, status: int, body: bytes) -> Callable[[sqlite3.Connection], None]:
+        return self.store.record_op(self.key, self.fingerprint, status, body)
+
+
+class _Pending:
+    __slots__ = ("fingerprint", "done")
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.done = asyncio.Event()
+
+
+class _Completed:
+    __slots__ = ("fingerprint", "status", "headers", "body")
+
+    def __init__(self, fingerprint: str, status: int, headers: list, body: bytes):
+        self.fingerprint = fingerprint
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+# ASGI中间件：带 Idempotency-Key 的请求只执行一次
+#
+# 相同的key重送时直接返回第一次的响应（不再验证、不再写入）；
+# 第一次还在处理中时，重送的请求会等待它完成。
+# 同一个key搭配不同的请求体视为客户端错误（422）。5xx响应不缓存，可以重试。
+#
+# cache是每个worker各自的前端缓存；store为共用的IdempotencyStore，
+# 缓存未命中时查询store，重送的请求到了另一个worker也会返回同一个结果。
+# 只有路由通过IdempotencyClaim记录的响应（例如建立订单）会写入store。
+class IdempotencyMiddleware:
+    def __init__(self, app, cache: TTLCache, store: Optional[IdempotencyStore] = None,
+                 paths: Sequence[str] = ("/orders",), methods: Sequence[str] = ("POST",)):
+        self.app = app
+        self.cache = cache
+        self.store = store
+        self.paths = frozenset(paths)
+        self.methods = frozenset(methods)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in self.methods or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        key = None
+        for name, value in scope["headers"]:
+            if name == b"idempotency-key":
+                key = value.decode("latin-1")
+                break
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        # 重放的响应不会到达路由，指标记在同一个路径下（paths都是完整路径）
+        scope[ROUTE_LABEL] = scope["path"]
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await _send_json(send, 400, {"detail": "Invalid Idempotency-Key"})
+            return
+
+        body = await _read_body(receive)
+        fingerprint = hashlib.sha256(body).hexdigest()
+        cache_key = (scope["method"], scope["path"], key)
+
+        store_key = f"{scope['method']} {scope['path']} {key}"
+
+        entry = self.cache.get(cache_key)
+        while isinstance(entry, _Pending):
+            await entry.done.wait()
+            entry = self.cache.get(cache_key)
+
+        if entry is None and self.store is not None:
+            entry = await self.store.get(store_key)
+            if entry is not None:
+                self.cache.set(cache_key, entry)
+            else:
+                # 查询期间同一个worker可能已开始处理同一个key
+                entry = self.cache.get(cache_key)
+                while isinstance(entry, _Pending):
+                    await entry.done.wait()
+                    entry = self.cache.get(cache_key)
+
+        if entry is not None:
+            await _replay(send, entry, fingerprint)
+            return
+
+        pending = _Pending(fingerprint)
+        self.cache.set(cache_key, pending)
+        if self.store is not None:
+            scope[IDEMPOTENCY_CLAIM] = IdempotencyClaim(self.store, store_key, fingerprint)
+
+        response = {"status": 500, "headers": [], "body": []}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        replayed = None
+        try:
+            try:
+                await self.app(scope, replay_receive, send_wrapper)
+            except IdempotencyConflict:
+                # 另一个worker已用同一个key建立订单（本次的写入已回滚），改为返回它的响应
+                replayed = await self.store.get(store_key)
+                if replayed is None:
+                    raise
+        finally:
+            if replayed is not None:
+                self.cache.set(cache_key, replayed)
+            elif response["status"] < 500:
+                self.cache.set(
+                    cache_key,
+                    _Completed(fingerprint, response["status"], response["headers"], b"".join(response["body"])),
+                )
+            else:
+                self.cache.delete(cache_key)
+            pending.done.set()
+        if replayed is not None:
+            await _replay(send, replayed, fingerprint)
+
+
+async def _replay(send, entry: _Completed, fingerprint: str) -> None:
+    if entry.fingerprint != fingerprint:
+        await _send_json(send, 422, {"detail": "Idempotency-Key was reused with a different request body"})
+        return
+    await send({
+        "type": "http.response.start",
+        "status": entry.status,
+        "headers": entry.headers + [(b"idempotent-replayed", b"true")],
+    })
+    await send({"type": "http.response.body", "body": entry.body})
+
+
+def _json_headers(body: bytes) -> list:
+    return [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+async def _send_json(send, status: int, content: dict) -> None:
+    body = json.dumps(content).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from order_store import OrderStore
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS inventory (
+    product_id INTEGER PRIMARY KEY,
+    available INTEGER NOT NULL CHECK (available >= 0)
+);
+CREATE TABLE IF NOT EXISTS reservations (
+    order_id TEXT NOT NULL,
+    product_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    expires_at REAL,
+    committed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (order_id, product_id)
+);
+CREATE INDEX IF NOT EXISTS idx_reservations_expires ON reservations (committed, expires_at);
+"""
+
+SEED_SQL = "INSERT OR IGNORE INTO inventory (product_id, available) VALUES (?, ?)"
+# 比较并扣减：库存不足时不更新任何行
+TAKE_SQL = "UPDATE inventory SET available = available - ? WHERE product_id = ? AND available >= ?"
+RESERVE_SQL = "INSERT INTO reservations (order_id, product_id, quantity, expires_at) VALUES (?, ?, ?, ?)"
+COMMIT_SQL = "UPDATE reservations SET committed = 1, expires_at = NULL WHERE order_id = ?"
+# 批量确认：订单ID以JSON数组传入
+COMMIT_MANY_SQL = "UPDATE reservations SET committed = 1, expires_at = NULL WHERE order_id IN (SELECT value FROM json_each(?))"
+RESERVED_SQL = "SELECT DISTINCT order_id FROM reservations WHERE order_id IN (SELECT value FROM json_each(?))"
+RESTORE_SQL = """
+UPDATE inventory SET available = available + (
+    SELECT quantity FROM reservations r WHERE r.order_id = ? AND r.product_id = inventory.product_id
+) WHERE product_id IN (SELECT product_id FROM reservations WHERE order_id = ?)
+"""
+DELETE_SQL = "DELETE FROM reservations WHERE order_id = ?"
+EXPIRED_SQL = "SELECT DISTINCT order_id FROM reservations WHERE committed = 0 AND expires_at <= ? LIMIT ?"
+
+ExpiredHandler = Callable[[List[str]], Awaitable[None]]
+
+
+class OutOfStock(Exception):
+    def __init__(self, product_id: int):
+        super().__init__(f"Product {product_id} is out of stock")
+        self.product_id = product_id
+
+
+# 库存预留：下单时一次预留订单所有品项，处理完成后确认，取消或逾期时归还
+#
+# 库存存在订单数据库中，与订单共用同一个写入队列（group commit），多个uvicorn worker
+# 共用同一份库存。每个品项以条件UPDATE（available >= 数量才扣减）比较并扣减，
+# 任何一项不足时回滚整张订单的预留，因此不会超卖，也不需要跨请求的锁。
+# 未确认的预留超过ttl秒会被定期归还，之后再确认会失败。
+class Inventory:
+    def __init__(self, store: OrderStore, ttl: float = 900, sweep_interval: float = 30, sweep_batch: int = 500):
+        self.store = store
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+        self.on_expired: Optional[ExpiredHandler] = None
+        self._sweeper: Optional[asyncio.Task] = None
+
+    # 建表并写入初始库存（已有库存的商品不覆盖）
+    async def start(self, initial: Dict[int, int]) -> None:
+        rows = list(initial.items())
+
+        def setup(conn: sqlite3.Connection) -> None:
+            for statement in SCHEMA.strip().split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+            conn.executemany(SEED_SQL, rows)
+
+        await self.store.transact(setup, size=len(rows) or 1)
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+
+    # 预留订单所有品项，库存不足时抛出OutOfStock（不预留任何品项）
+    async def reserve(self, order_id: str, items: List[dict]) -> None:
+        await self.store.transact(self._reserve_op(order_id, items), size=len(items) or 1)
+
+    # 批量预留（整批一个写入操作），返回每笔订单的错误信息，成功为None
+    #
+    # 整批的库存都足够时（常见情况）按商品合计一次扣减；否则每笔订单一个savepoint依序预留，
+    # 库存不足的订单只回滚自己的预留。
+    async def reserve_many(self, records: List[dict]) -> List[Optional[str]]:
+        if not records:
+            return []
+        orders = [(record["id"], _lines(record["items"])) for record in records]
+        expires_at = time.time() + self.ttl
+        totals: Dict[int, int] = {}
+        for _, lines in orders:
+            for product_id, quantity in lines:
+                totals[product_id] = totals.get(product_id, 0) + quantity
+        rows = [(order_id, p, q, expires_at) for order_id, lines in orders for p, q in lines]
+
+        def op(conn: sqlite3.Connection) -> List[Optional[str]]:
+            conn.execute("SAVEPOINT reserve")
+            try:
+                _take(conn, sorted(totals.items()))
+                conn.executemany(RESERVE_SQL, rows)
+            except OutOfStock:
+                conn.execute("ROLLBACK TO reserve")
+            else:
+                conn.execute("RELEASE reserve")
+                return [None] * len(orders)
+            conn.execute("RELEASE reserve")
+
+            errors: List[Optional[str]] = []
+            for order_id, lines in orders:
+                conn.execute("SAVEPOINT reserve")
+                try:
+                    _take(conn, lines)
+                    conn.executemany(RESERVE_SQL, [(order_id, p, q, expires_at) for p, q in lines])
+                except OutOfStock as exc:
+                    conn.execute("ROLLBACK TO reserve")
+                    errors.append(str(exc))
+                else:
+                    errors.append(None)
+                conn.execute("RELEASE reserve")
+            return errors
+
+        return await self.store.transact(op, size=len(rows) or 1)
+
+    def _reserve_op(self, order_id: str, items: List[dict]):
+        lines = _lines(items)
+        expires_at = time.time() + self.ttl
+
+        def op(conn: sqlite3.Connection) -> None:
+            _take(conn, lines)
+            conn.executemany(RESERVE_SQL, [(order_id, p, q, expires_at) for p, q in lines])
+
+        return op
+
+    # 确认预留（库存正式扣除），预留已被归还（逾期或取消）时返回False
+    async def commit(self, order_id: str) -> bool:
+        def op(conn: sqlite3.Connection) -> bool:
+            return conn.execute(COMMIT_SQL, (order_id,)).rowcount > 0
+
+        return await self.store.transact(op)
+
+    # 批量确认（一个写入操作），返回确认成功的订单ID
+    async def commit_many(self, order_ids: List[str]) -> Set[str]:
+        ids = json.dumps(order_ids)
+
+        def op(conn: sqlite3.Connection) -> Set[str]:
+            conn.execute(COMMIT_MANY_SQL, (ids,))
+            return {row[0] for row in conn.execute(RESERVED_SQL, (ids,))}
+
+        return await self.store.transact(op, size=len(order_ids) or 1)
+
+    # 归还订单的预留（包括已确认的），没有可归还的预留时返回False
+    async def release(self, order_id: str) -> bool:
+        return await self.store.transact(lambda conn: _release(conn, order_id))
+
+    async def available(self, product_id: int) -> Optional[int]:
+        levels = await self.levels([product_id])
+        return levels.get(product_id)
+
+    async def levels(self, product_ids: Optional[List[int]] = None) -> Dict[int, int]:
+        sql = "SELECT product_id, available FROM inventory"
+        params: list = []
+        if product_ids is not None:
+            sql += " WHERE product_id IN (%s)" % ", ".join("?" * len(product_ids))
+            params = list(product_ids)
+        return await self.store.read(lambda conn: dict(conn.execute(sql, params).fetchall()))
+
+    # 归还逾期未确认的预留，返回被归还的订单ID
+    async def expire(self) -> List[str]:
+        now = time.time()
+        limit = self.sweep_batch
+
+        def op(conn: sqlite3.Connection) -> List[str]:
+            order_ids = [row[0] for row in conn.execute(EXPIRED_SQL, (now, limit))]
+            for order_id in order_ids:
+                _release(conn, order_id)
+            return order_ids
+
+        return await self.store.transact(op, size=limit)
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                order_ids = await self.expire()
+                if order_ids and self.on_expired is not None:
+                    await self.on_expired(order_ids)
+            except Exception:
+                logger.exception("Failed to expire reservations")
+
+
+# 同一商品的多个品项合并，按商品ID顺序排列
+def _lines(items: List[dict]) -> List[Tuple[int, int]]:
+    quantities: Dict[int, int] = {}
+    for item in items:
+        quantities[item["productId"]] = quantities.get(item["productId"], 0) + item["quantity"]
+    return sorted(quantities.items())
+
+
+# 按顺序比较并扣减，任何一项不足时抛出OutOfStock（由调用方回滚）
+def _take(conn: sqlite3.Connection, lines: List[Tuple[int, int]]) -> None:
+    for product_id, quantity in lines:
+        if conn.execute(TAKE_SQL, (quantity, product_id, quantity)).rowcount == 0:
+            raise OutOfStock(product_id)
+
+
+def _release(conn: sqlite3.Connection, order_id: str) -> bool:
+    conn.execute(RESTORE_SQL, (order_id, order_id))
+    return conn.execute(DELETE_SQL, (order_id,)).rowcount > 0
@@ -0,0 +1,333 @@
+"""濠鮮嚴選API压力测试
+
+启动本机的 main:app（或连线到 --url 指定的服务），以asyncio模拟多个虚拟使用者
+依比例执行浏览、切换类别、查看商品、下单与查询订单，最后以JSON输出各情境的
+RPS与延迟百分位数，方便跨commit比较。
+
+    python loadtest.py --users 50 --duration 30 --output result.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import closing
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 本机服务的库存，足够整个测试期间下单不会售完
+LOADTEST_STOCK = 10 ** 9
+
+# 情境与权重
+SCENARIOS = {
+    "browse_all": 30,
+    "tap_category": 30,
+    "view_product": 25,
+    "submit_order": 10,
+    "poll_order": 5,
+}
+
+CATEGORIES = ["fish", "shrimp", "shellfish", "meat"]
+
+
+# 最小的HTTP/1.1 keep-alive客户端（不依赖第三方套件）
+class Connection:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, body: Optional[bytes] = None) -> Tuple[int, bytes]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+        headers = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}"]
+        if body is not None:
+            headers += ["Content-Type: application/json", f"Content-Length: {len(body)}"]
+        self.writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + (body or b""))
+
+        try:
+            return await self._read_response()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.close()
+            raise
+
+    async def _read_response(self) -> Tuple[int, bytes]:
+        status_line = await self.reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+
+        length = None
+        chunked = False
+        keep_alive = True
+        while True:
+            line = await self.reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name = name.strip().lower()
+            value = value.strip()
+            if name == "content-length":
+                length = int(value)
+            elif name == "transfer-encoding" and value.lower() == "chunked":
+                chunked = True
+            elif name == "connection" and value.lower() == "close":
+                keep_alive = False
+
+        if chunked:
+            body = b""
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if size == 0:
+                    await self.reader.readuntil(b"\r\n")
+                    break
+                body += await self.reader.readexactly(size)
+                await self.reader.readexactly(2)
+        elif length is not None:
+            body = await self.reader.readexactly(length)
+        else:
+            body = b""
+
+        if not keep_alive:
+            self.close()
+        return status, body
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = None
+        self.writer = None
+
+
+def make_order(rng: random.Random, products: List[dict]) -> dict:
+    items = []
+    for product in rng.sample(products, rng.randint(1, min(4, len(products)))):
+        items.append({
+            "productId": product["id"],
+            "name": product["name"],
+            "price": product["price"],
+            "quantity": rng.randint(1, 3),
+        })
+    return {
+        "items": items,
+        "total": sum(item["price"] * item["quantity"] for item in items),
+        "customerName": "壓測用戶",
+        "phone": "0912345678",
+        "email": "loadtest@example.com",
+        "address": "台北市中正區測試路1號",
+        "paymentMethod": rng.choice(["cash", "credit", "transfer"]),
+        "orderDate": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+# 单一虚拟使用者：在截止时间前依权重重复执行情境
+async def virtual_user(
+    user_id: int,
+    host: str,
+    port: int,
+    products: List[dict],
+    deadline: float,
+    seed: int,
+    think_time: float,
+    samples: Dict[str, List[Tuple[float, bool]]],
+) -> None:
+    rng = random.Random(seed * 100003 + user_id)
+    names = list(SCENARIOS)
+    weights = [SCENARIOS[name] for name in names]
+    conn = Connection(host, port)
+    order_ids: List[str] = []
+
+    while time.monotonic() < deadline:
+        scenario = rng.choices(names, weights)[0]
+        if scenario == "poll_order" and not order_ids:
+            scenario = "submit_order"
+
+        if scenario == "browse_all":
+            method, path, body, expected = "GET", "/products", None, 200
+        elif scenario == "tap_category":
+            method, path, body, expected = "GET", f"/products/category/{rng.choice(CATEGORIES)}", None, 200
+        elif scenario == "view_product":
+            method, path, body, expected = "GET", f"/products/{rng.choice(products)['id']}", None, 200
+        elif scenario == "submit_order":
+            body = json.dumps(make_order(rng, products), ensure_ascii=False).encode("utf-8")
+            method, path, expected = "POST", "/orders", 200
+        else:
+            method, path, body, expected = "GET", f"/orders/{rng.choice(order_ids)}", None, 200
+
+        start = time.perf_counter()
+        try:
+            status, response = await conn.request(method, path, body)
+            ok = status == expected
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            status, response, ok = 0, b"", False
+        samples[scenario].append((time.perf_counter() - start, ok))
+
+        if ok and scenario == "submit_order":
+            order_ids.append(json.loads(response)["orderId"])
+        if think_time:
+            await asyncio.sleep(rng.uniform(0, think_time * 2))
+
+    conn.close()
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples: List[Tuple[float, bool]], elapsed: float) -> dict:
+    latencies = sorted(latency for latency, _ in samples)
+    errors = sum(1 for _, ok in samples if not ok)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+            "p50": round(percentile(latencies, 0.50) * 1000, 3),
+            "p90": round(percentile(latencies, 0.90) * 1000, 3),
+            "p95": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+    }
+
+
+async def run(host: str, port: int, users: int, duration: float, seed: int, think_time: float) -> dict:
+    conn = Connection(host, port)
+    status, body = await conn.request("GET", "/products")
+    conn.close()
+    if status != 200:
+        raise RuntimeError(f"GET /products returned {status}")
+    products = json.loads(body)
+
+    samples: Dict[str, List[Tuple[float, bool]]] = {name: [] for name in SCENARIOS}
+    start = time.monotonic()
+    deadline = start + duration
+    await asyncio.gather(*(
+        virtual_user(user_id, host, port, products, deadline, seed, think_time, samples)
+        for user_id in range(users)
+    ))
+    elapsed = time.monotonic() - start
+
+    everything = [sample for values in samples.values() for sample in values]
+    return {
+        "total": summarize(everything, elapsed),
+        "scenarios": {name: summarize(values, elapsed) for name, values in samples.items()},
+        "elapsed_seconds": round(elapsed, 3),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# 在暂存的订单资料库上启动本机服务，等待 /health 回应
+def start_server(port: int, workers: int, db_path: str) -> subprocess.Popen:
+    # 所有虚拟使用者来自同一个IP，关闭限流以测量服务本身的容量
+    env = dict(os.environ, ORDER_DB_PATH=db_path, RATE_LIMIT_ENABLED="0")
+    command = [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers), "--log-level", "warning",
+    ]
+    # 服务的输出导向stderr，stdout只留给JSON结果
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=sys.stderr)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("uvicorn exited during startup")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1) as sock:
+                sock.sendall(b"GET /health HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+                if sock.recv(64).startswith(b"HTTP/1.1 200"):
+                    seed_inventory(db_path)
+                    return process
+        except OSError:
+            pass
+        time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError("uvicorn did not become healthy within 30s")
+
+
+# 暂存资料库的库存补满，下单不会因为售完而变成409
+def seed_inventory(db_path: str) -> None:
+    with closing(sqlite3.connect(db_path, timeout=30)) as conn:
+        conn.execute("UPDATE inventory SET available = ?", (LOADTEST_STOCK,))
+        conn.commit()
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="濠鮮嚴選API压力测试")
+    parser.add_argument("--url", help="测试已运行的服务（预设启动本机的 main:app）")
+    parser.add_argument("--users", type=int, default=50, help="虚拟使用者数")
+    parser.add_argument("--duration", type=float, default=30, help="测试秒数")
+    parser.add_argument("--workers", type=int, default=1, help="本机服务的uvicorn worker数")
+    parser.add_argument("--think-time", type=float, default=0, help="平均思考时间（秒）")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子，相同种子产生相同的请求序列")
+    parser.add_argument("--output", help="JSON结果输出档（预设输出到stdout）")
+    args = parser.parse_args()
+
+    process = None
+    tmpdir = None
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port = parts.hostname, parts.port or 80
+    else:
+        tmpdir = tempfile.TemporaryDirectory()
+        host, port = "127.0.0.1", free_port()
+        process = start_server(port, args.workers, os.path.join(tmpdir.name, "orders.db"))
+
+    try:
+        result = asyncio.run(run(host, port, args.users, args.duration, args.seed, args.think_time))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+    report = {
+        "commit": git_commit(),
+        "target": args.url or "local",
+        "users": args.users,
+        "duration": args.duration,
+        "workers": None if args.url else args.workers,
+        "seed": args.seed,
+        "think_time": args.think_time,
+        **result,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,75 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, ValidationError, conint
+from typing import AsyncIterator, List, Optional, Sequence
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
+import base64
+import json
+import os
 import uuid
 from datetime import datetime
 
-app = FastAPI(title="濠鮮嚴選API")
+from catalog import Catalog
+from catalog_cache import CatalogResponseCache, etag_matches
+from events import ALL, EventBroker, stream
+from idempotency import IDEMPOTENCY_CLAIM, IdempotencyMiddleware, IdempotencyStore, TTLCache
+from inventory import Inventory, OutOfStock
+from metrics import Metrics, MetricsMiddleware
+from order_store import OrderStore
+from pipeline import OrderPipeline
+from pricing import PricingEngine
+from ratelimit import PRIORITY_HIGH, LoopLagMonitor, RateLimitMiddleware, RateLimitRule
+from search import ProductSearch
+from serialization import ResponseClass, RouteClass, dumps, loads
+from thumbnails import ThumbnailService
+
+app = FastAPI(title="濠鮮嚴選API", default_response_class=ResponseClass)
+# FAST_JSON=1 时请求体也用orjson解析（需在定义路由前设置）
+app.router.route_class = RouteClass
+
+# 订单存储（SQLite，多个worker共用同一个数据库文件）
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+ORDER_DB_PATH = os.environ.get(
+    "ORDER_DB_PATH",
+    os.path.join(BACKEND_DIR, "data", "orders.db"),
+)
+order_store = OrderStore(ORDER_DB_PATH)
+
+# 下单的Idempotency-Key去重（放在CORS内层，重放的响应同样带CORS头）
+# key与订单一起写入订单数据库，所有worker共用；TTLCache只是每个worker的前端缓存
+IDEMPOTENCY_TTL = float(os.environ.get("IDEMPOTENCY_TTL", "86400"))
+idempotency_store = IdempotencyStore(order_store, ttl=IDEMPOTENCY_TTL)
+app.add_middleware(
+    IdempotencyMiddleware,
+    cache=TTLCache(
+        max_entries=int(os.environ.get("IDEMPOTENCY_MAX_ENTRIES", "10000")),
+        ttl=IDEMPOTENCY_TTL,
+    ),
+    store=idempotency_store,
+    paths=["/orders"],
+)
+
+# 限流与降载（放在CORS内层，被拒绝的响应同样带CORS头）
+# 规则按顺序匹配，未匹配的路径（/health、/metrics）不限流
+load_monitor = LoopLagMonitor()
+if os.environ.get("RATE_LIMIT_ENABLED", "1") != "0":
+    app.add_middleware(
+        RateLimitMiddleware,
+        rules=[
+            # 下单优先：只有在事件循环严重延迟时才降载
+            RateLimitRule("orders", ["POST"], "/orders", client_rate=5, client_burst=10,
+                          global_rate=200, global_burst=400, priority=PRIORITY_HIGH),
+            RateLimitRule("catalog", ["GET"], "/products", client_rate=20, client_burst=40,
+                          global_rate=1000, global_burst=2000),
+            RateLimitRule("order_status", ["GET"], "/orders", client_rate=10, client_burst=20),
+        ],
+        monitor=load_monitor,
+        shed_lag=float(os.environ.get("LOAD_SHED_LAG", "0.2")),
+        shed_lag_high=float(os.environ.get("LOAD_SHED_LAG_HIGH", "1.0")),
+        trust_forwarded=os.environ.get("TRUST_X_FORWARDED_FOR", "0") == "1",
+    )
 
 # 启用CORS
 app.add_middleware(
@@ -16,6 +80,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求指标（每个worker各自统计）
+metrics = Metrics()
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
 # 产品模型
 class Product(BaseModel):
     id: int
@@ -27,12 +95,16 @@ class Product(BaseModel):
     onSale: Optional[bool] = False
     originalPrice: Optional[float] = None
 
+# 单一品项的数量上限；商品ID不超过int64（计价与库存以int64计算，超出范围视为无效订单而不是500）
+MAX_ITEM_QUANTITY = int(os.environ.get("MAX_ITEM_QUANTITY", "10000"))
+MAX_PRODUCT_ID = 2**63 - 1
+
 # 订单项目模型
 class OrderItem(BaseModel):
-    productId: int
+    productId: conint(ge=1, le=MAX_PRODUCT_ID)
     name: str
     price: float
-    quantity: int
+    quantity: conint(ge=1, le=MAX_ITEM_QUANTITY)
     onSale: Optional[bool] = False
     originalPrice: Optional[float] = None
 
@@ -58,7 +130,8 @@ products = [
         "onSale": True,
         "image": "https://images.unsplash.com/photo-1603048297172-c92544798d5a?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3",
         "description": "紐西蘭頂級草飼牛排",
-        "category": "meat"
+        "category": "meat",
+        "stock": 40
     },
     {
         "id": 2,
@@ -66,7 +139,8 @@ products = [
         "price": 359,
         "image": "https://images.unsplash.com/photo-1602470520998-f4a52199a3d6?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3",
         "description": "日本進口松阪豬，油花均勻",
-        "category": "meat"
+        "category": "meat",
+        "stock": 60
     },
     {
         "id": 3,
@@ -74,7 +148,8 @@ products = [
         "price": 189,
         "image": "https://images.unsplash.com/photo-1587593810167-a84920ea0781?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3",
         "description": "新鮮去骨雞腿，真空包裝",
-        "category": "meat"
+        "category": "meat",
+        "stock": 50
     },
     {
         "id": 4,
@@ -82,7 +157,8 @@ products = [
         "price": 399,
         "image": "https://images.unsplash.com/photo-1623855244183-52fd8d3ce2f7?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3",
         "description": "嚴選深海大蝦，急速冷凍保鮮",
-        "category": "shrimp"
+        "category": "shrimp",
+        "stock": 80
     },
     {
         "id": 5,
@@ -90,7 +166,8 @@ products = [
         "price": 299,
         "image": "https://images.unsplash.com/photo-1485921325833-c519f76c4927?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3",
         "description": "挪威進口鮭魚，真空包裝",
-        "category": "fish"
+        "category": "fish",
+        "stock": 30
     },
     {
         "id": 6,
@@ -98,7 +175,8 @@ products = [
         "price": 259,
         "image": "https://images.unsplash.com/photo-1574071318508-1cdbab80d002?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3",
         "description": "新鮮花枝，切片即食",
-        "category": "fish"
+        "category": "fish",
+        "stock": 45
     },
     {
         "id": 7,
@@ -106,7 +184,8 @@ products = [
         "price": 329,
         "image": "https://images.unsplash.com/photo-1519708227418-c8fd9a32b7a2?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3",
         "description": "深海鱈魚，肉質鮮嫩",
-        "category": "fish"
+        "category": "fish",
+        "stock": 35
     },
     {
         "id": 8,
@@ -116,7 +195,8 @@ products = [
         "onSale": True,
         "image": "https://images.unsplash.com/photo-1498579687545-d5a4fffb0a9e?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3",
         "description": "新鮮生蠔，海洋的滋味",
-        "category": "shellfish"
+        "category": "shellfish",
+        "stock": 70
     },
     {
         "id": 9,
@@ -124,7 +204,8 @@ products = [
         "price": 459,
         "image": "https://images.unsplash.com/photo-1569494315581-13efc7e67d1e?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3",
         "description": "北海道扇貝，肉質飽滿",
-        "category": "shellfish"
+        "category": "shellfish",
+        "stock": 55
     },
     {
         "id": 10,
@@ -132,7 +213,8 @@ products = [
         "price": 359,
         "image": "https://images.unsplash.com/photo-1559737558-2f5a35f4523b?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3",
         "description": "台灣白蝦，鮮甜可口",
-        "category": "shrimp"
+        "category": "shrimp",
+        "stock": 90
     },
     {
         "id": 11,
@@ -142,7 +224,8 @@ products = [
         "onSale": True,
         "image": "https://images.unsplash.com/photo-1550747545-c896b5f89ff7?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3",
         "description": "波士頓龍蝦，肉質鮮美",
-        "category": "shrimp"
+        "category": "shrimp",
+        "stock": 65
     },
     {
         "id": 12,
@@ -150,73 +233,450 @@ products = [
         "price": 1599,
         "image": "https://images.unsplash.com/photo-1559737706-1f3b1d657d3c?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3",
         "description": "阿拉斯加帝王蟹，鮮甜多汁",
-        "category": "shellfish"
+        "category": "shellfish",
+        "stock": 15
     }
 ]
 
-# 存储订单的字典
-orders = {}
+# 商品目录索引（启动时建立）
+catalog = Catalog(products)
+
+# 订单计价（以商品目录价格重新计算）
+pricing = PricingEngine(catalog)
+
+# 商品全文检索（目录载入时建立倒排索引）
+product_search = ProductSearch(catalog)
+
+# 商品目录响应缓存（已编码的JSON + ETag）
+catalog_responses = CatalogResponseCache(
+    catalog, Product, max_age=int(os.environ.get("CATALOG_MAX_AGE", "60"))
+)
+
+# 商品缩图（来源图片为 {PRODUCT_IMAGE_DIR}/{商品ID}.jpg，缩图缓存在磁盘上）
+thumbnails = ThumbnailService(
+    source_dir=os.environ.get("PRODUCT_IMAGE_DIR", os.path.join(BACKEND_DIR, "images")),
+    cache_dir=os.environ.get("THUMBNAIL_CACHE_DIR", os.path.join(BACKEND_DIR, "data", "thumbnails")),
+    max_bytes=int(os.environ.get("THUMBNAIL_CACHE_MAX_MB", "256")) * 1024 * 1024,
+)
+THUMBNAIL_MAX_AGE = int(os.environ.get("THUMBNAIL_MAX_AGE", "86400"))
+
+# 订单状态事件（SSE推送给等待中的客户端，每个worker各自发布）
+order_events = EventBroker()
+SSE_KEEPALIVE = float(os.environ.get("SSE_KEEPALIVE", "15"))
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+# 进入这些状态后订单不会再变化，单笔订单的串流随之结束
+TERMINAL_STATUSES = ("cancelled", "failed", "expired")
+
+# 更新订单状态并通知订阅者，返回订单是否被更新
+async def set_order_status(order_id: str, status: str, only_from: Optional[Sequence[str]] = None) -> bool:
+    updated = await order_store.update_status(order_id, status, only_from=only_from)
+    if updated:
+        order_events.publish(order_id, {"orderId": order_id, "status": status})
+    return updated
+
+# 库存预留（与订单存在同一个数据库，所有worker共用；初始库存取自商品的stock）
+inventory = Inventory(
+    order_store,
+    ttl=float(os.environ.get("INVENTORY_RESERVATION_TTL", "900")),
+    sweep_interval=float(os.environ.get("INVENTORY_SWEEP_INTERVAL", "30")),
+)
+
+# 预留逾期仍未处理完成的订单
+async def expire_orders(order_ids: List[str]):
+    for order_id in order_ids:
+        await set_order_status(order_id, "expired", only_from=("pending",))
+
+inventory.on_expired = expire_orders
+
+# 下单后的非同步处理（订单先以pending回应，其余步骤在背景执行）
+order_pipeline = OrderPipeline(
+    workers=int(os.environ.get("ORDER_PIPELINE_WORKERS", "4")),
+    queue_size=int(os.environ.get("ORDER_PIPELINE_QUEUE_SIZE", "1000")),
+)
+
+# 最后一个阶段：确认库存预留，订单转为processing（已被取消的订单不改变状态）
+# 整组订单一次确认、一次更新状态；预留已被归还（逾期或取消）的订单逐笔标为failed
+@order_pipeline.stage("confirm")
+async def confirm_orders(records: List[dict]):
+    committed = await inventory.commit_many([record["id"] for record in records])
+    for record in records:
+        if record["id"] not in committed:
+            await fail_order(record, "confirm", RuntimeError("Inventory reservation expired or was released"))
+    confirmed = [record["id"] for record in records if record["id"] in committed]
+    for order_id in await order_store.update_status_many(confirmed, "processing", only_from=("pending",)):
+        order_events.publish(order_id, {"orderId": order_id, "status": "processing"})
+
+async def fail_order(record: dict, stage: str, exc: BaseException):
+    await inventory.release(record["id"])
+    await set_order_status(record["id"], "failed", only_from=("pending",))
+
+order_pipeline.on_error = fail_order
+
+# 可以取消的订单状态
+CANCELLABLE_STATUSES = ("pending", "processing")
+
+# 批量导入时每次写入的订单数
+ORDER_BATCH_CHUNK = int(os.environ.get("ORDER_BATCH_CHUNK", "1000"))
+
+# 订单转为dict：直接复制已验证的字段，比order.dict()的递归转换快得多
+def order_to_dict(order: Order) -> dict:
+    record = dict(order.__dict__)
+    record["items"] = [dict(item.__dict__) for item in order.items]
+    return record
+
+# 建立新订单记录
+def new_order_record(order: Order) -> dict:
+    record = order_to_dict(order)
+    record["id"] = str(uuid.uuid4())
+    record["status"] = "pending"
+    record["createdAt"] = datetime.now().isoformat()
+    return record
+
+# 逐行读取请求内容（不把整个请求体读进内存）
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
 
 # 路由：获取所有产品
 @app.get("/products", response_model=List[Product])
-async def get_products():
-    return products
+async def get_products(request: Request):
+    return catalog_responses.respond(request, "all", catalog.all)
 
 # 路由：按类别获取产品
 @app.get("/products/category/{category}", response_model=List[Product])
-async def get_products_by_category(category: str):
-    if category == "all":
-        return products
-    
-    filtered_products = [p for p in products if p["category"] == category]
-    return filtered_products
+async def get_products_by_category(category: str, request: Request):
+    items = catalog.by_category(category)
+    # 不存在的类别共用同一个空列表缓存
+    key = f"category:{category}" if items else "category:"
+    return catalog_responses.respond(request, key, lambda: items)
+
+# 路由：搜索产品（prefix=true用于输入时的自动补全）
+# 须在 /products/{product_id} 之前注册，否则 "search" 会被当成产品ID
+@app.get("/products/search", response_model=List[Product])
+async def search_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=100),
+    prefix: bool = False,
+):
+    return product_search.search(q, limit=limit, prefix=prefix)
 
 # 路由：获取单个产品
 @app.get("/products/{product_id}", response_model=Product)
-async def get_product(product_id: int):
-    for product in products:
-        if product["id"] == product_id:
-            return product
-    raise HTTPException(status_code=404, detail="Product not found")
+async def get_product(product_id: int, request: Request):
+    product = catalog.get(product_id)
+    if product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return catalog_responses.respond(request, f"product:{product_id}", lambda: product)
+
+# 路由：获取产品缩图（未指定format时依Accept选择WebP或JPEG）
+@app.get("/products/{product_id}/image")
+async def get_product_image(
+    product_id: int,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=4096),
+    format: Optional[str] = Query(None, regex="^(webp|jpeg)$"),
+):
+    if catalog.get(product_id) is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    fmt = format or ("webp" if "image/webp" in request.headers.get("accept", "") else "jpeg")
+    thumbnail = await thumbnails.get(product_id, thumbnails.width_for(w), fmt)
+    if thumbnail is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    headers = {"ETag": thumbnail.etag, "Cache-Control": f"public, max-age={THUMBNAIL_MAX_AGE}"}
+    if format is None:
+        headers["Vary"] = "Accept"
+    if etag_matches(request.headers.get("if-none-match"), thumbnail.etag):
+        return Response(status_code=304, headers=headers)
+    # 先读进内存再回应（缩图不大）：其他worker淘汰档案时read()会重新产生，不会回应到一半找不到档案
+    return Response(await thumbnails.read(thumbnail), media_type=thumbnail.media_type, headers=headers)
 
 # 路由：提交订单
 @app.post("/orders", response_model=dict)
-async def create_order(order: Order):
-    # 生成唯一订单ID
-    order_id = str(uuid.uuid4())
+async def create_order(order: Order, request: Request):
+    # 生成唯一订单ID，添加订单状态
+    record = new_order_record(order)
+    order_id = record["id"]
+    
+    # 以商品目录价格重新计价
+    error = pricing.apply([record])[0]
+    if error is not None:
+        raise HTTPException(status_code=422, detail=error)
     
-    # 保存订单
-    orders[order_id] = order.dict()
+    # 背景处理已积压时拒绝新订单
+    if order_pipeline.full():
+        raise HTTPException(status_code=503, detail="Order processing is busy", headers={"Retry-After": "1"})
     
-    # 添加订单ID和状态
-    orders[order_id]["id"] = order_id
-    orders[order_id]["status"] = "pending"
-    orders[order_id]["createdAt"] = datetime.now().isoformat()
+    # 预留库存，任何一项不足时整张订单不预留
+    try:
+        await inventory.reserve(order_id, record["items"])
+    except OutOfStock as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
     
-    return {
+    body = dumps({
         "message": "Order created successfully", 
         "orderId": order_id,
-        "status": "pending"
-    }
+        "status": "pending",
+        "total": record["total"]
+    })
+    
+    # 保存订单（与同时到达的订单合并提交），带Idempotency-Key时key与响应在同一个事务中记录
+    # 其余处理交给背景流水线
+    claim = request.scope.get(IDEMPOTENCY_CLAIM)
+    try:
+        await order_store.add(record, with_op=claim.record_op(200, body) if claim is not None else None)
+    except Exception:
+        await inventory.release(order_id)
+        raise
+    order_events.publish(order_id, {"orderId": order_id, "status": "pending"})
+    await order_pipeline.submit(record)
+    
+    return Response(content=body, media_type="application/json")
+
+# 路由：批量导入订单（NDJSON，每行一笔订单）
+@app.post("/orders/batch", response_model=dict)
+async def create_orders_batch(request: Request):
+    results = []
+    chunk = []
+    chunk_results = []
+    line_no = 0
+    # 上一批的写入（与解析下一批同时进行，同一时间最多一批在写入）
+    writing: Optional[asyncio.Task] = None
+
+    async def flush(chunk: List[dict], chunk_results: List[dict]):
+        # 整批一次计价，计价失败的订单不写入
+        errors = pricing.apply(chunk)
+        priced = []
+        for record, result, error in zip(chunk, chunk_results, errors):
+            if error is None:
+                priced.append((record, result))
+            else:
+                result.pop("orderId")
+                result["status"] = "invalid"
+                result["error"] = error
+
+        # 预留库存，库存不足的订单不写入
+        errors = await inventory.reserve_many([record for record, _ in priced])
+        records = []
+        reserved_results = []
+        for (record, result), error in zip(priced, errors):
+            if error is None:
+                records.append(record)
+                reserved_results.append(result)
+            else:
+                result.pop("orderId")
+                result["status"] = "rejected"
+                result["error"] = error
+
+        try:
+            await order_store.add_many(records)
+        except Exception as exc:
+            for record in records:
+                await inventory.release(record["id"])
+            for result in reserved_results:
+                result.pop("orderId")
+                result["status"] = "failed"
+                result["error"] = str(exc)
+        else:
+            # 整批作为一个工作送入流水线（满时在此等待，导入速度跟着背景处理调整）
+            for record in records:
+                order_events.publish(record["id"], {"orderId": record["id"], "status": "pending"})
+            await order_pipeline.submit_many(records)
+
+    try:
+        async for line in iter_lines(request.stream()):
+            line_no += 1
+            if not line.strip():
+                continue
+
+            try:
+                order = Order.parse_obj(loads(line))
+            except ValidationError as exc:
+                results.append({"line": line_no, "status": "invalid", "error": jsonable_encoder(exc.errors())})
+                continue
+            except ValueError as exc:
+                # JSON格式错误
+                results.append({"line": line_no, "status": "invalid", "error": str(exc)})
+                continue
+
+            record = new_order_record(order)
+            result = {"line": line_no, "status": "pending", "orderId": record["id"]}
+            results.append(result)
+            chunk.append(record)
+            chunk_results.append(result)
+            if len(chunk) >= ORDER_BATCH_CHUNK:
+                if writing is not None:
+                    await writing
+                writing = asyncio.ensure_future(flush(chunk, chunk_results))
+                chunk, chunk_results = [], []
+
+        if writing is not None:
+            await writing
+            writing = None
+        if chunk:
+            await flush(chunk, chunk_results)
+    finally:
+        # 请求中断时等上一批写完（已预留的库存与已写入的订单保持一致）
+        if writing is not None:
+            await asyncio.gather(writing, return_exceptions=True)
+
+    # 逐行结果都是基本类型，直接编码，不经过jsonable_encoder逐项转换
+    accepted = sum(1 for result in results if result["status"] == "pending")
+    return Response(content=dumps({
+        "accepted": accepted,
+        "rejected": len(results) - accepted,
+        "results": results,
+    }), media_type="application/json")
+
+# 分页游标：上一页最后一笔订单的(createdAt, id)
+def encode_cursor(record: dict) -> str:
+    raw = json.dumps([record["createdAt"], record["id"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(created_at), str(order_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def normalize_datetime(value: Optional[str], name: str) -> Optional[str]:
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}")
+
+# 路由：订单列表（按createdAt倒序，游标分页）
+@app.get("/orders", response_model=dict)
+async def list_orders(
+    status: Optional[str] = None,
+    payment_method: Optional[str] = Query(None, alias="paymentMethod"),
+    created_from: Optional[str] = Query(None, alias="createdFrom"),
+    created_to: Optional[str] = Query(None, alias="createdTo"),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+):
+    items = await order_store.query(
+        status=status,
+        payment_method=payment_method,
+        created_from=normalize_datetime(created_from, "createdFrom"),
+        created_to=normalize_datetime(created_to, "createdTo"),
+        after=decode_cursor(cursor) if cursor else None,
+        limit=limit + 1,
+    )
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1])
+
+    return {"items": items, "nextCursor": next_cursor}
+
+# 路由：全部订单的状态变化（SSE，供管理端使用）
+# 须在 /orders/{order_id} 之前注册
+@app.get("/orders/events")
+async def stream_all_order_events():
+    return StreamingResponse(
+        stream(order_events, ALL, keepalive=SSE_KEEPALIVE),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+# 路由：单笔订单的状态变化（SSE），先送出目前状态，订单进入终止状态后结束
+@app.get("/orders/{order_id}/events")
+async def stream_order_events(order_id: str):
+    if await order_store.get(order_id) is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+
+    async def snapshot():
+        order = await order_store.get(order_id)
+        return None if order is None else {"orderId": order_id, "status": order["status"]}
+
+    return StreamingResponse(
+        stream(
+            order_events, order_id, snapshot,
+            keepalive=SSE_KEEPALIVE,
+            until=lambda event: event["status"] in TERMINAL_STATUSES,
+        ),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
 
 # 路由：获取订单状态
 @app.get("/orders/{order_id}", response_model=dict)
 async def get_order(order_id: str):
-    if order_id not in orders:
+    data = await order_store.get_raw(order_id)
+    if data is None:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    return orders[order_id]
+    # 存储的就是订单JSON，直接返回
+    return Response(content=data, media_type="application/json")
+
+# 路由：取消订单（归还预留或已扣除的库存）
+@app.post("/orders/{order_id}/cancel", response_model=dict)
+async def cancel_order(order_id: str):
+    order = await order_store.get(order_id)
+    if order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if order["status"] not in CANCELLABLE_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Order cannot be cancelled in status {order['status']}")
+
+    await inventory.release(order_id)
+    if not await set_order_status(order_id, "cancelled", only_from=CANCELLABLE_STATUSES):
+        raise HTTPException(status_code=409, detail="Order status changed, please retry")
+    return {"message": "Order cancelled", "orderId": order_id, "status": "cancelled"}
+
+# 路由：目前库存
+@app.get("/inventory", response_model=dict)
+async def get_inventory():
+    levels = await inventory.levels()
+    return {str(product_id): available for product_id, available in levels.items()}
+
+# 路由：单个产品的目前库存
+@app.get("/inventory/{product_id}", response_model=dict)
+async def get_product_inventory(product_id: int):
+    available = await inventory.available(product_id)
+    if available is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return {"productId": product_id, "available": available}
 
 # 健康检查端点
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+# 指标端点（Prometheus文本格式）
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # 启动时的消息
 @app.on_event("startup")
 async def startup_event():
+    await order_store.start()
+    await idempotency_store.start()
+    await inventory.start({product["id"]: product.get("stock", 0) for product in products})
+    await order_pipeline.start()
+    await load_monitor.start()
     print("濠鮮嚴選API已启动")
 
+# 关闭时先处理完流水线中的订单，再写完队列中的订单
+@app.on_event("shutdown")
+async def shutdown_event():
+    await load_monitor.stop()
+    await inventory.stop()
+    await order_pipeline.close()
+    await order_store.close()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,136 @@
+import bisect
+import time
+from typing import Dict, List, Tuple
+
+# 延迟直方图的分桶上界（秒）
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+# 没有匹配到路由的请求统一归类，避免任意路径产生无限多的标签
+UNMATCHED_ROUTE = "<unmatched>"
+# 在到达路由之前就直接响应的中间件（限流、冪等重放）把路由标签放进scope的这个键
+ROUTE_LABEL = "metrics.route"
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    # 由分桶估计分位数（桶内线性插值，与Prometheus的histogram_quantile相同）
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                if index == len(BUCKETS):
+                    return BUCKETS[-1]
+                lower = BUCKETS[index - 1] if index else 0.0
+                upper = BUCKETS[index]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return BUCKETS[-1]
+
+
+# 请求指标：按路由模板（如 /products/{product_id}）统计请求数、进行中请求数与延迟
+class Metrics:
+    def __init__(self):
+        self.in_flight = 0
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+
+    def observe(self, method: str, route: str, status: int, seconds: float) -> None:
+        key = (method, route, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+
+        histogram = self.latency.get((method, route))
+        if histogram is None:
+            histogram = self.latency[(method, route)] = Histogram()
+        histogram.observe(seconds)
+
+    # Prometheus文本格式
+    def render(self) -> str:
+        lines: List[str] = [
+            "# HELP http_requests_total Total HTTP requests.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, status), count in sorted(self.requests.items()):
+            lines.append(f'http_requests_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {count}')
+
+        lines += [
+            "# HELP http_requests_in_flight HTTP requests currently being served.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP http_request_duration_seconds HTTP request latency.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        latency = sorted(self.latency.items())
+        for (method, route), histogram in latency:
+            labels = f'method="{method}",route="{_escape(route)}"'
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS, histogram.counts):
+                cumulative += bucket_count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {histogram.count}")
+
+        lines += [
+            "# HELP http_request_duration_quantile_seconds Estimated HTTP request latency quantiles.",
+            "# TYPE http_request_duration_quantile_seconds gauge",
+        ]
+        for (method, route), histogram in latency:
+            labels = f'method="{method}",route="{_escape(route)}"'
+            for q in QUANTILES:
+                lines.append(
+                    f'http_request_duration_quantile_seconds{{{labels},quantile="{q}"}} {histogram.quantile(q):.6f}'
+                )
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# ASGI中间件：记录每个HTTP请求的路由、状态码与耗时
+class MetricsMiddleware:
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = self.metrics
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.in_flight -= 1
+            # 路由匹配后FastAPI会把路由对象放进scope
+            route = scope.get("route")
+            path = getattr(route, "path", None) or scope.get(ROUTE_LABEL) or UNMATCHED_ROUTE
+            metrics.observe(scope["method"], path, status, elapsed)
@@ -0,0 +1,298 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from serialization import dumps, loads
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payment_method TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_orders_created ON orders (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders (status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_orders_payment_created ON orders (payment_method, created_at, id);
+"""
+
+INSERT_SQL = "INSERT INTO orders (id, created_at, status, payment_method, data) VALUES (?, ?, ?, ?, ?)"
+UPDATE_STATUS_SQL = "UPDATE orders SET status = ?, data = json_set(data, '$.status', ?) WHERE id = ?"
+# 批量更新状态：订单ID以JSON数组传入
+UPDATE_STATUS_MANY_SQL = "UPDATE orders SET status = ?, data = json_set(data, '$.status', ?) WHERE id IN (SELECT value FROM json_each(?))"
+SELECT_IDS_SQL = "SELECT id FROM orders WHERE id IN (SELECT value FROM json_each(?))"
+
+
+# 订单存储：SQLite（WAL模式），由单一写入任务批量提交（group commit）
+#
+# 并发的写入请求先进入队列，写入任务每次把队列中积压的订单合并为一个事务，
+# 因此一次fsync可以确认多笔订单。读取使用各线程自己的连接，在WAL模式下
+# 不会被写入阻塞，多个uvicorn worker也可以共用同一个数据库文件。
+class OrderStore:
+    def __init__(self, path: str, max_batch: int = 512):
+        self.path = path
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._write_conn: Optional[sqlite3.Connection] = None
+        # 所有写入都在同一个线程执行，保证提交顺序
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="order-writer")
+        self._local = threading.local()
+        self._read_conns: List[sqlite3.Connection] = []
+        self._read_conns_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+    def _open_writer(self) -> sqlite3.Connection:
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._read_conns_lock:
+                self._read_conns.append(conn)
+        return conn
+
+    async def start(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        loop = asyncio.get_running_loop()
+        self._write_conn = await loop.run_in_executor(self._write_executor, self._open_writer)
+        self._queue = asyncio.Queue()
+        self._writer = asyncio.create_task(self._write_loop())
+
+    # 等待队列中的订单全部写入后关闭
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._queue.put_nowait(None)
+            await self._writer
+            self._writer = None
+
+        loop = asyncio.get_running_loop()
+        if self._write_conn is not None:
+            await loop.run_in_executor(self._write_executor, self._write_conn.close)
+            self._write_conn = None
+        self._write_executor.shutdown(wait=True)
+
+        with self._read_conns_lock:
+            for conn in self._read_conns:
+                conn.close()
+            self._read_conns.clear()
+
+    # 写入一笔订单；with_op(conn)与订单在同一个savepoint中执行（例如记录Idempotency-Key），
+    # 抛出异常时订单不写入，异常传给调用方
+    async def add(self, record: dict, with_op: Optional[Callable[[sqlite3.Connection], Any]] = None) -> None:
+        if with_op is None:
+            await self.add_many([record])
+            return
+        row = _to_row(record)
+
+        def op(conn: sqlite3.Connection) -> None:
+            with_op(conn)
+            conn.execute(INSERT_SQL, row)
+
+        await self.transact(op)
+
+    # 写入多笔订单，返回时已确认落盘
+    async def add_many(self, records: List[dict]) -> None:
+        if records:
+            await self._submit(INSERT_SQL, [_to_row(record) for record in records])
+
+    # 更新订单状态（与写入共用同一个提交队列），only_from指定时只从这些状态转换
+    # 返回订单是否被更新
+    async def update_status(self, order_id: str, status: str, only_from: Optional[Sequence[str]] = None) -> bool:
+        sql = UPDATE_STATUS_SQL
+        params: tuple = (status, status, order_id)
+        if only_from is not None:
+            sql += " AND status IN (%s)" % ", ".join("?" * len(only_from))
+            params += tuple(only_from)
+        return await self._submit(sql, [params]) > 0
+
+    # 批量更新订单状态（一个写入操作），返回被更新的订单ID
+    async def update_status_many(self, order_ids: List[str], status: str, only_from: Optional[Sequence[str]] = None) -> List[str]:
+        if not order_ids:
+            return []
+        select_sql = SELECT_IDS_SQL
+        update_sql = UPDATE_STATUS_MANY_SQL
+        ids = json.dumps(order_ids)
+        extra: tuple = ()
+        if only_from is not None:
+            condition = " AND status IN (%s)" % ", ".join("?" * len(only_from))
+            select_sql += condition
+            update_sql += condition
+            extra = tuple(only_from)
+
+        # 写入线程依序执行，查询与更新之间不会有其他写入
+        def op(conn: sqlite3.Connection) -> List[str]:
+            updated = [row[0] for row in conn.execute(select_sql, (ids,) + extra)]
+            conn.execute(update_sql, (status, status, ids) + extra)
+            return updated
+
+        return await self.transact(op, size=len(order_ids))
+
+    # 返回受影响的行数
+    async def _submit(self, sql: str, rows: List[tuple]) -> int:
+        return await self.transact(lambda conn: conn.executemany(sql, rows).rowcount, size=len(rows))
+
+    # 在写入线程执行func(conn)，与其他写入合并在同一个事务中提交，返回func的结果
+    #
+    # 每个操作有自己的savepoint，func抛出异常时只回滚这个操作，异常会传给调用方，
+    # 同一批的其他操作照常提交。size为操作的行数，用来控制每批的大小。
+    async def transact(self, func: Callable[[sqlite3.Connection], Any], size: int = 1) -> Any:
+        if self._queue is None:
+            raise RuntimeError("OrderStore has not been started")
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((func, size, future))
+        return await future
+
+    # 在读取线程执行func(conn)（各线程自己的连接，不会被写入阻塞）
+    async def read(self, func: Callable[[sqlite3.Connection], Any]) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: func(self._reader()))
+
+    async def get(self, order_id: str) -> Optional[dict]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._get, order_id)
+
+    def _get(self, order_id: str) -> Optional[dict]:
+        data = self._get_raw(order_id)
+        return None if data is None else loads(data)
+
+    # 直接返回存储的JSON，不经过解码再编码
+    async def get_raw(self, order_id: str) -> Optional[bytes]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._get_raw, order_id)
+
+    def _get_raw(self, order_id: str) -> Optional[bytes]:
+        row = self._reader().execute("SELECT data FROM orders WHERE id = ?", (order_id,)).fetchone()
+        return None if row is None else row[0].encode("utf-8")
+
+    # 按createdAt倒序分页（keyset）：after为上一页最后一笔的(createdAt, id)
+    #
+    # 每个筛选条件都有以(条件, created_at, id)排序的索引，
+    # 翻到第几页都只需从索引定位后读取limit笔。
+    async def query(
+        self,
+        status: Optional[str] = None,
+        payment_method: Optional[str] = None,
+        created_from: Optional[str] = None,
+        created_to: Optional[str] = None,
+        after: Optional[Tuple[str, str]] = None,
+        limit: int = 50,
+    ) -> List[dict]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, self._query, status, payment_method, created_from, created_to, after, limit
+        )
+
+    def _query(self, status, payment_method, created_from, created_to, after, limit) -> List[dict]:
+        conditions = []
+        params: list = []
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if payment_method is not None:
+            conditions.append("payment_method = ?")
+            params.append(payment_method)
+        if created_from is not None:
+            conditions.append("created_at >= ?")
+            params.append(created_from)
+        if created_to is not None:
+            conditions.append("created_at < ?")
+            params.append(created_to)
+        if after is not None:
+            conditions.append("(created_at, id) < (?, ?)")
+            params.extend(after)
+
+        sql = "SELECT data FROM orders"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit)
+
+        rows = self._reader().execute(sql, params).fetchall()
+        return [loads(row[0]) for row in rows]
+
+    async def _write_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+
+            # 合并队列中已积压的写入请求
+            batch = [item]
+            size = item[1]
+            while size < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                size += item[1]
+
+            try:
+                results = await loop.run_in_executor(self._write_executor, self._write, batch)
+            except Exception as exc:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+            else:
+                for (_, _, future), (ok, result) in zip(batch, results):
+                    if future.done():
+                        continue
+                    if ok:
+                        future.set_result(result)
+                    else:
+                        future.set_exception(result)
+
+    # 在同一个事务中按顺序执行整批写入，返回每个操作的(是否成功, 结果或异常)
+    def _write(self, batch: List[tuple]) -> List[Tuple[bool, Any]]:
+        conn = self._write_conn
+        results = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for func, _, _ in batch:
+                conn.execute("SAVEPOINT op")
+                try:
+                    result = func(conn)
+                except Exception as exc:
+                    conn.execute("ROLLBACK TO op")
+                    conn.execute("RELEASE op")
+                    results.append((False, exc))
+                else:
+                    conn.execute("RELEASE op")
+                    results.append((True, result))
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return results
+
+
+def _to_row(record: dict) -> tuple:
+    return (
+        record["id"],
+        record["createdAt"],
+        record["status"],
+        record.get("paymentMethod"),
+        dumps(record).decode("utf-8"),
+    )
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+StageFunc = Callable[[List[dict]], Awaitable[None]]
+ErrorHandler = Callable[[dict, str, BaseException], Awaitable[None]]
+
+
+class _Stage:
+    def __init__(self, name: str, func: StageFunc, workers: int, queue_size: int):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue_size = queue_size
+        self.queue: Optional[asyncio.Queue] = None
+        self.tasks: List[asyncio.Task] = []
+
+
+# 下单后的非同步处理流水线
+#
+# 每个阶段有自己的有界队列与worker，订单依序通过各阶段。下游阶段的队列满了，
+# 上游worker会在put时等待，压力一路传回到submit；调用方可先用full()检查，
+# 入口已满时直接拒绝新订单。
+# 队列中的每个工作是一组订单：单笔下单为一笔，批量导入为一整批（submit_many），
+# 阶段函数收到整组订单，可以一次写入整批。队列容量以工作数计算。
+# 某个阶段抛出异常时，这组订单不再进入后续阶段，改为对每笔订单调用on_error。
+class OrderPipeline:
+    def __init__(self, workers: int = 4, queue_size: int = 1000):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.on_error: Optional[ErrorHandler] = None
+        self._stages: List[_Stage] = []
+        self._started = False
+
+    # 注册处理阶段（按注册顺序执行），可当作装饰器使用
+    def stage(self, name: str, workers: Optional[int] = None, queue_size: Optional[int] = None):
+        def register(func: StageFunc) -> StageFunc:
+            if self._started:
+                raise RuntimeError("Cannot add stages to a running pipeline")
+            self._stages.append(_Stage(
+                name,
+                func,
+                workers if workers is not None else self.workers,
+                queue_size if queue_size is not None else self.queue_size,
+            ))
+            return func
+        return register
+
+    async def start(self) -> None:
+        for index, stage in enumerate(self._stages):
+            stage.queue = asyncio.Queue(maxsize=stage.queue_size)
+            next_stage = self._stages[index + 1] if index + 1 < len(self._stages) else None
+            stage.tasks = [
+                asyncio.create_task(self._worker(stage, next_stage))
+                for _ in range(stage.workers)
+            ]
+        self._started = True
+
+    # 入口队列是否已满（满时下单请求应先拒绝，而不是写入后才发现排不进去）
+    def full(self) -> bool:
+        return bool(self._stages) and self._stages[0].queue is not None and self._stages[0].queue.full()
+
+    # 送入流水线，入口队列满时等待
+    async def submit(self, record: dict) -> None:
+        await self.submit_many([record])
+
+    # 把一组订单作为一个工作送入流水线
+    async def submit_many(self, records: List[dict]) -> None:
+        if self._stages and records:
+            await self._stages[0].queue.put(list(records))
+
+    async def _worker(self, stage: _Stage, next_stage: Optional[_Stage]) -> None:
+        while True:
+            records = await stage.queue.get()
+            try:
+                await stage.func(records)
+            except Exception as exc:
+                logger.exception("%d order(s) failed in stage %s (first: %s)", len(records), stage.name, records[0].get("id"))
+                if self.on_error is not None:
+                    for record in records:
+                        try:
+                            await self.on_error(record, stage.name, exc)
+                        except Exception:
+                            logger.exception("Error handler failed for order %s", record.get("id"))
+            else:
+                if next_stage is not None:
+                    await next_stage.queue.put(records)
+            finally:
+                stage.queue.task_done()
+
+    # 关闭前等待所有已接受的订单处理完毕（逐阶段排空）
+    async def drain(self) -> None:
+        for stage in self._stages:
+            if stage.queue is not None:
+                await stage.queue.join()
+
+    async def close(self) -> None:
+        if not self._started:
+            return
+        await self.drain()
+        for stage in self._stages:
+            for task in stage.tasks:
+                task.cancel()
+            await asyncio.gather(*stage.tasks, return_exceptions=True)
+            stage.tasks = []
+        self._started = False
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from metrics import ROUTE_LABEL
+
+# 优先级：负载过高时先拒绝低优先级的请求
+PRIORITY_LOW = 0
+PRIORITY_HIGH = 1
+
+
+class RateLimitRule:
+    def __init__(
+        self,
+        name: str,
+        methods: Sequence[str],
+        path_prefix: str,
+        client_rate: Optional[float] = None,
+        client_burst: Optional[float] = None,
+        global_rate: Optional[float] = None,
+        global_burst: Optional[float] = None,
+        priority: int = PRIORITY_LOW,
+    ):
+        self.name = name
+        self.methods = frozenset(methods)
+        self.path_prefix = path_prefix
+        self.client_rate = client_rate
+        self.client_burst = client_burst if client_burst is not None else client_rate
+        self.global_rate = global_rate
+        self.global_burst = global_burst if global_burst is not None else global_rate
+        self.priority = priority
+
+    def matches(self, method: str, path: str) -> bool:
+        return method in self.methods and path.startswith(self.path_prefix)
+
+
+# 令牌桶：bucket为[剩余令牌, 上次更新时间]，返回需要等待的秒数（0表示通过）
+def _take(bucket: list, rate: float, burst: float, now: float) -> float:
+    tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+    bucket[1] = now
+    if tokens >= 1:
+        bucket[0] = tokens - 1
+        return 0.0
+    bucket[0] = tokens
+    return (1 - tokens) / rate
+
+
+# 事件循环延迟监测：定时sleep，实际醒来的时间比预期晚多少就是排队延迟
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.05, smoothing: float = 0.3):
+        self.interval = interval
+        self.smoothing = smoothing
+        self.lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            delay = max(0.0, loop.time() - expected)
+            # 指数平滑，避免单次抖动就触发降载
+            self.lag += (delay - self.lag) * self.smoothing
+
+
+# ASGI中间件：按路由规则做每个客户端与全局的令牌桶限流，事件循环延迟过高时降载
+#
+# - 超过限流返回429，超过降载门槛返回503，两者都带Retry-After
+# - 低优先级的请求在延迟超过shed_lag时即被拒绝，高优先级（下单）要到shed_lag_high才拒绝
+# - 每个活跃客户端只保存一个令牌桶，闲置超过idle_ttl或超过max_clients时按LRU淘汰
+class RateLimitMiddleware:
+    def __init__(
+        self,
+        app,
+        rules: List[RateLimitRule],
+        monitor: Optional[LoopLagMonitor] = None,
+        shed_lag: float = 0.2,
+        shed_lag_high: float = 1.0,
+        idle_ttl: float = 300,
+        max_clients: int = 100000,
+        trust_forwarded: bool = False,
+    ):
+        self.app = app
+        self.rules = rules
+        self.monitor = monitor
+        self.shed_lag = shed_lag
+        self.shed_lag_high = shed_lag_high
+        self.idle_ttl = idle_ttl
+        self.max_clients = max_clients
+        self.trust_forwarded = trust_forwarded
+        self._global: Dict[str, list] = {}
+        self._clients: "OrderedDict[Tuple[str, str], list]" = OrderedDict()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        rule = self._match(scope["method"], scope["path"])
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        if self.monitor is not None:
+            threshold = self.shed_lag_high if rule.priority >= PRIORITY_HIGH else self.shed_lag
+            if self.monitor.lag > threshold:
+                await _reject(scope, send, rule, 503, "Server is overloaded", math.ceil(self.monitor.lag) or 1)
+                return
+
+        now = time.monotonic()
+
+        if rule.client_rate:
+            client = self._client_id(scope)
+            self._evict(now)
+            key = (rule.name, client)
+            bucket = self._clients.get(key)
+            if bucket is None:
+                bucket = self._clients[key] = [rule.client_burst, now]
+            else:
+                self._clients.move_to_end(key)
+            wait = _take(bucket, rule.client_rate, rule.client_burst, now)
+            if wait:
+                await _reject(scope, send, rule, 429, "Too many requests", math.ceil(wait))
+                return
+
+        if rule.global_rate:
+            bucket = self._global.get(rule.name)
+            if bucket is None:
+                bucket = self._global[rule.name] = [rule.global_burst, now]
+            wait = _take(bucket, rule.global_rate, rule.global_burst, now)
+            if wait:
+                await _reject(scope, send, rule, 429, "Too many requests", math.ceil(wait))
+                return
+
+        await self.app(scope, receive, send)
+
+    def _match(self, method: str, path: str) -> Optional[RateLimitRule]:
+        for rule in self.rules:
+            if rule.matches(method, path):
+                return rule
+        return None
+
+    def _client_id(self, scope) -> str:
+        if self.trust_forwarded:
+            for name, value in scope["headers"]:
+                if name == b"x-forwarded-for":
+                    return value.decode("latin-1").split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    # 淘汰闲置的令牌桶（最久未使用的在最前面，每次只检查开头几个）
+    def _evict(self, now: float) -> None:
+        clients = self._clients
+        while clients:
+            key, bucket = next(iter(clients.items()))
+            if len(clients) > self.max_clients or now - bucket[1] > self.idle_ttl:
+                clients.popitem(last=False)
+            else:
+                break
+
+
+async def _reject(scope, send, rule: RateLimitRule, status: int, detail: str, retry_after: int) -> None:
+    # 被拒绝的请求不会到达路由，指标以规则名称标记
+    scope[ROUTE_LABEL] = f"<{rule.name}>"
+    body = json.dumps({"detail": detail}).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
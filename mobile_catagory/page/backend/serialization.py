@@ -0,0 +1,62 @@
+import json
+import os
+from typing import Any
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import APIRoute
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 设置环境变量 FAST_JSON=1 启用orjson编解码（输出格式不变）
+FAST_JSON = os.environ.get("FAST_JSON", "").lower() in ("1", "true", "yes")
+
+if FAST_JSON and orjson is None:
+    raise RuntimeError("FAST_JSON requires orjson (pip install orjson)")
+
+
+def dumps(content: Any) -> bytes:
+    if FAST_JSON:
+        return orjson.dumps(content)
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def loads(data) -> Any:
+    if FAST_JSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# 默认响应类别
+ResponseClass = ORJSONResponse if FAST_JSON else JSONResponse
+
+
+# 用orjson解析请求体的Request
+class FastJSONRequest(Request):
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = loads(await self.body())
+        return self._json
+
+
+# 路由类别：把请求换成FastJSONRequest后交给FastAPI原本的处理流程
+class FastJSONRoute(APIRoute):
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request):
+            return await handler(FastJSONRequest(request.scope, request.receive))
+
+        return route_handler
+
+
+RouteClass = FastJSONRoute if FAST_JSON else APIRoute
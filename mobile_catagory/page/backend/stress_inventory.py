@@ -0,0 +1,140 @@
+"""库存预留压力测试：多个进程同时抢购少量库存，检查没有超卖
+
+    python stress_inventory.py --processes 4 --checkouts 2000
+
+每个进程模拟一个uvicorn worker（各自的OrderStore共用同一个数据库文件），
+同时送出大量随机的多品项下单，其中一部分确认、一部分取消、一部分放着等逾期。
+结束后检查：
+- 每个商品的库存都不小于0
+- 初始库存 = 剩余库存 + 仍被预留（含已确认）的数量
+- 各进程回报成功预留且未归还的数量，与数据库中的预留一致
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Tuple
+
+from inventory import Inventory, OutOfStock
+from order_store import OrderStore
+
+
+async def worker(path: str, stock: Dict[int, int], checkouts: int, seed: int, ttl: float) -> Tuple[Dict[int, int], int, int]:
+    rng = random.Random(seed)
+    store = OrderStore(path)
+    await store.start()
+    inventory = Inventory(store, ttl=ttl, sweep_interval=ttl / 2)
+    await inventory.start(stock)
+    product_ids = list(stock)
+    held: Dict[int, int] = {}
+    counts = {"reserved": 0, "rejected": 0}
+
+    async def checkout() -> None:
+        order_id = str(uuid.uuid4())
+        items = [
+            {"productId": product_id, "quantity": rng.randint(1, 3)}
+            for product_id in rng.sample(product_ids, rng.randint(1, 3))
+        ]
+        try:
+            await inventory.reserve(order_id, items)
+        except OutOfStock:
+            counts["rejected"] += 1
+            return
+        counts["reserved"] += 1
+
+        await asyncio.sleep(rng.random() * 0.05)
+        action = rng.random()
+        if action < 0.6:
+            # 确认：如果已经逾期被归还，确认会失败
+            if not await inventory.commit(order_id):
+                return
+        elif action < 0.8:
+            await inventory.release(order_id)
+            return
+        else:
+            # 放着不确认，等逾期后由清理任务归还
+            await asyncio.sleep(ttl * 3)
+            if not await inventory.commit(order_id):
+                return
+        for item in items:
+            held[item["productId"]] = held.get(item["productId"], 0) + item["quantity"]
+
+    await asyncio.gather(*(checkout() for _ in range(checkouts)))
+    await inventory.stop()
+    await store.close()
+    return held, counts["reserved"], counts["rejected"]
+
+
+def run_worker(args) -> Tuple[Dict[int, int], int, int]:
+    return asyncio.run(worker(*args))
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser(description="库存预留压力测试")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--checkouts", type=int, default=2000, help="每个进程的并发下单数")
+    parser.add_argument("--products", type=int, default=5)
+    parser.add_argument("--stock", type=int, default=300, help="每个商品的初始库存")
+    parser.add_argument("--ttl", type=float, default=0.5, help="预留逾期秒数")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    stock = {product_id: args.stock for product_id in range(1, args.products + 1)}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "orders.db")
+        # 先建表，避免多个进程同时建表
+        asyncio.run(worker(path, stock, 0, 0, args.ttl))
+
+        start = time.perf_counter()
+        jobs = [(path, stock, args.checkouts, args.seed + i, args.ttl) for i in range(args.processes)]
+        with multiprocessing.Pool(args.processes) as pool:
+            results = pool.map(run_worker, jobs)
+        elapsed = time.perf_counter() - start
+
+        conn = sqlite3.connect(path)
+        available = dict(conn.execute("SELECT product_id, available FROM inventory"))
+        reserved = dict(conn.execute("SELECT product_id, SUM(quantity) FROM reservations GROUP BY product_id"))
+        pending = conn.execute("SELECT COUNT(*) FROM reservations WHERE committed = 0").fetchone()[0]
+        conn.close()
+
+    held: Dict[int, int] = {}
+    for worker_held, _, _ in results:
+        for product_id, quantity in worker_held.items():
+            held[product_id] = held.get(product_id, 0) + quantity
+    total_reserved = sum(r for _, r, _ in results)
+    total_rejected = sum(r for _, _, r in results)
+    total = args.processes * args.checkouts
+
+    print(f"{total} checkouts in {elapsed:.2f}s ({total / elapsed:.0f}/s): "
+          f"{total_reserved} reserved, {total_rejected} out of stock")
+    print(f"{'product':>8}{'initial':>10}{'available':>11}{'sold':>8}")
+    failures: List[str] = []
+    for product_id, initial in stock.items():
+        left = available.get(product_id, 0)
+        sold = reserved.get(product_id, 0)
+        print(f"{product_id:>8}{initial:>10}{left:>11}{sold:>8}")
+        if left < 0:
+            failures.append(f"product {product_id}: negative stock {left}")
+        if left + sold != initial:
+            failures.append(f"product {product_id}: {left} available + {sold} sold != {initial}")
+        if held.get(product_id, 0) != sold:
+            failures.append(f"product {product_id}: workers hold {held.get(product_id, 0)}, database has {sold}")
+    if pending:
+        failures.append(f"{pending} reservations neither committed nor released")
+
+    if failures:
+        print("FAILED")
+        for failure in failures:
+            print("  " + failure)
+        sys.exit(1)
+    print("OK: no overselling")
+
+
+if __name__ == "__main__":
+    run()
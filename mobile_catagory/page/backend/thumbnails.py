@@ -0,0 +1,213 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Sequence
+
+try:
+    import fcntl
+except ImportError:  # Windows没有fcntl
+    fcntl = None
+
+import PIL
+from PIL import Image
+
+# 来源图片的副档名（按顺序查找 {商品ID}.{副档名}）
+SOURCE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+
+
+class Thumbnail:
+    __slots__ = ("path", "etag", "media_type", "source", "width", "format")
+
+    def __init__(self, path: str, etag: str, media_type: str, source: str, width: int, fmt: str):
+        self.path = path
+        self.etag = etag
+        self.media_type = media_type
+        self.source = source
+        self.width = width
+        self.format = fmt
+
+
+# 商品缩图：从本地来源图片产生指定宽度的WebP/JPEG，存放在有容量上限的磁盘LRU缓存
+#
+# 缓存档名由来源图片（路径、大小、修改时间）、宽度、格式、品质与Pillow版本计算而来，
+# 相同的输入一定产生相同的内容，因此档名本身就是强ETag；来源图片更新后自然换成新档名。
+# 宽度只接受固定的几个尺寸（请求的宽度向上取到最近的尺寸），避免任意宽度把缓存撑爆。
+# 缩图在执行绪池中产生，同一个缩图同时被请求时只产生一次（同一个worker内）。
+#
+# 多个worker共用缓存目录：最近使用的时间记在档案的修改时间上（命中时最多每touch_interval秒更新一次），
+# 每次产生新缩图后在目录锁内扫描整个目录，超过容量时删除修改时间最旧的档案，
+# 因此容量上限对所有worker合计。缩图可能在读取前被其他worker删除，read()会重新产生。
+class ThumbnailService:
+    def __init__(
+        self,
+        source_dir: str,
+        cache_dir: str,
+        max_bytes: int = 256 * 1024 * 1024,
+        widths: Sequence[int] = (160, 320, 480, 640, 960),
+        quality: int = 80,
+        touch_interval: float = 60,
+    ):
+        self.source_dir = source_dir
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.widths = tuple(sorted(widths))
+        self.quality = quality
+        self.touch_interval = touch_interval
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._lock_path = os.path.join(cache_dir, ".lock")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._evict()
+
+    def width_for(self, requested: Optional[int]) -> int:
+        if requested is None:
+            return self.widths[len(self.widths) // 2]
+        for width in self.widths:
+            if width >= requested:
+                return width
+        return self.widths[-1]
+
+    def _source(self, product_id: int) -> Optional[str]:
+        for extension in SOURCE_EXTENSIONS:
+            path = os.path.join(self.source_dir, f"{product_id}{extension}")
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def _key(self, source: str, width: int, fmt: str) -> str:
+        stat = os.stat(source)
+        parts = (source, stat.st_size, stat.st_mtime_ns, width, fmt, self.quality, PIL.__version__)
+        return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()[:32]
+
+    # 取得缩图（需要时产生），来源图片不存在时返回None
+    async def get(self, product_id: int, width: int, fmt: str) -> Optional[Thumbnail]:
+        source = self._source(product_id)
+        if source is None:
+            return None
+
+        key = self._key(source, width, fmt)
+        thumbnail = Thumbnail(os.path.join(self.cache_dir, f"{key}.{fmt}"), f'"{key}"', FORMATS[fmt][1], source, width, fmt)
+        if not self._touch(thumbnail.path):
+            await self._ensure(thumbnail)
+        return thumbnail
+
+    # 读取缩图内容；档案已被其他worker淘汰时重新产生
+    async def read(self, thumbnail: Thumbnail) -> bytes:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                return await loop.run_in_executor(None, _read_file, thumbnail.path)
+            except FileNotFoundError:
+                await self._ensure(thumbnail)
+
+    # 档案存在时更新最近使用时间并返回True
+    def _touch(self, path: str) -> bool:
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return False
+        if time.time() - mtime >= self.touch_interval:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                return False
+        return True
+
+    async def _ensure(self, thumbnail: Thumbnail) -> None:
+        name = os.path.basename(thumbnail.path)
+        future = self._pending.get(name)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(
+                None, self._render, thumbnail.source, name, thumbnail.width, thumbnail.format
+            )
+            self._pending[name] = future
+            try:
+                await future
+            finally:
+                del self._pending[name]
+        else:
+            await asyncio.shield(future)
+
+    # 产生缩图（在执行绪池中执行），先写入暂存档再改名，其他进程不会读到写一半的档案
+    def _render(self, source: str, name: str, width: int, fmt: str) -> None:
+        with Image.open(source) as image:
+            image.draft("RGB", (width, width * image.height // max(image.width, 1)))
+            image = image.convert("RGB")
+            if image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                image = image.resize((width, height), Image.LANCZOS)
+
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-")
+            try:
+                with os.fdopen(fd, "wb") as output:
+                    image.save(output, FORMATS[fmt][0], quality=self.quality, optimize=True)
+                os.replace(temp_path, os.path.join(self.cache_dir, name))
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        self._evict(keep=name)
+
+    # 在目录锁内扫描缓存目录，超过容量时删除最久未使用的缩图（至少保留keep，或最新的一个）
+    def _evict(self, keep: Optional[str] = None) -> None:
+        with _directory_lock(self._lock_path):
+            files = []
+            total = 0
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                total += stat.st_size
+                if entry.name != keep:
+                    files.append((stat.st_mtime, entry.name, stat.st_size))
+            files.sort()
+            if keep is None and files:
+                files.pop()
+
+            for _, name, size in files:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    # Windows上正在被读取的档案无法删除，留到下次
+                    continue
+                total -= size
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+_process_locks: Dict[str, threading.Lock] = {}
+_process_locks_guard = threading.Lock()
+
+
+# 缓存目录锁：同一进程内用threading.Lock，跨进程用flock（Windows没有fcntl，只锁同一进程）
+@contextmanager
+def _directory_lock(path: str):
+    with _process_locks_guard:
+        lock = _process_locks.setdefault(os.path.abspath(path), threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        with open(path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -1,17 +1,21 @@
 // 全局變量
 let cart = [];
 let checkoutItemsContainer;
+let checkoutSubtotalElement;
+let checkoutShippingElement;
 let checkoutTotalElement;
 let toastElement;
 let checkoutForm;
 
 // 导入API函数
-import { submitOrder } from './api.js';
+import { submitOrder, watchOrderStatus } from './api.js';
 
 // 頁面載入時執行
 document.addEventListener('DOMContentLoaded', function() {
     // 獲取DOM元素
     checkoutItemsContainer = document.getElementById('checkout-items');
+    checkoutSubtotalElement = document.getElementById('checkout-subtotal');
+    checkoutShippingElement = document.getElementById('checkout-shipping');
     checkoutTotalElement = document.getElementById('checkout-total');
     toastElement = document.getElementById('toast');
     checkoutForm = document.getElementById('checkout-form');
@@ -54,12 +58,12 @@ function displayCheckoutItems() {
     }
     
     // 計算總價
-    let total = 0;
+    let subtotal = 0;
     
     // 為每個結帳項目創建HTML
     cart.forEach((item, index) => {
         const itemTotal = item.price * item.quantity;
-        total += itemTotal;
+        subtotal += itemTotal;
         
         const checkoutItemElement = document.createElement('div');
         checkoutItemElement.className = 'checkout-item';
@@ -81,8 +85,11 @@ function displayCheckoutItems() {
         checkoutItemsContainer.appendChild(checkoutItemElement);
     });
     
-    // 更新總價顯示
-    checkoutTotalElement.textContent = total;
+    // 更新總價顯示（含運費，與伺服器計價一致）
+    const shippingFee = calculateShippingFee(subtotal);
+    checkoutSubtotalElement.textContent = subtotal;
+    checkoutShippingElement.textContent = shippingFee;
+    checkoutTotalElement.textContent = subtotal + shippingFee;
     
     // 添加數量控制按鈕事件
     document.querySelectorAll('.minus-btn').forEach(button => {
@@ -99,6 +106,20 @@ function displayCheckoutItems() {
     });
 }
 
+// 運費規則（與後端 pricing.py 相同）：商品小計滿 3000 元免運，否則 150 元
+const FREE_SHIPPING_THRESHOLD = 3000;
+const SHIPPING_FEE = 150;
+
+function calculateShippingFee(subtotal) {
+    return subtotal >= FREE_SHIPPING_THRESHOLD ? 0 : SHIPPING_FEE;
+}
+
+// 訂單總額（商品小計加運費）
+function calculateOrderTotal(items) {
+    const subtotal = items.reduce((total, item) => total + (item.price * item.quantity), 0);
+    return subtotal + calculateShippingFee(subtotal);
+}
+
 // 減少數量
 function decreaseQuantity(event) {
     const index = parseInt(event.target.getAttribute('data-index'));
@@ -140,6 +161,27 @@ function saveCart() {
     localStorage.setItem('cart', JSON.stringify(cart));
 }
 
+// 取得本次結帳的請求：內容相同的重新送出沿用同一個冪等鍵與訂單資料，
+// 避免網路不穩時重複下單；內容改變則視為新的結帳
+function getPendingCheckout(orderData) {
+    const { orderDate, ...content } = orderData;
+    const fingerprint = JSON.stringify(content);
+    const saved = JSON.parse(sessionStorage.getItem('pendingCheckout') || 'null');
+    if (saved && saved.fingerprint === fingerprint) {
+        return saved;
+    }
+    
+    const pending = {
+        key: (window.crypto && crypto.randomUUID)
+            ? crypto.randomUUID()
+            : `${Date.now()}-${Math.random().toString(36).slice(2)}`,
+        fingerprint,
+        orderData
+    };
+    sessionStorage.setItem('pendingCheckout', JSON.stringify(pending));
+    return pending;
+}
+
 // 處理結帳提交
 function handleCheckout(event) {
     event.preventDefault();
@@ -156,22 +198,34 @@ function handleCheckout(event) {
         payment: formData.get('payment'),
         notes: formData.get('notes'),
         items: cart,
-        total: cart.reduce((total, item) => total + (item.price * item.quantity), 0),
+        total: calculateOrderTotal(cart),
         orderDate: new Date().toISOString()
     };
     
     // 使用新的API接口提交訂單
-    submitOrder(orderData).then(() => {
+    const pending = getPendingCheckout(orderData);
+    submitOrder(pending.orderData, pending.key).then((result) => {
         console.log('訂單提交成功');
         
         // 清空購物車
         localStorage.removeItem('cart');
+        sessionStorage.removeItem('pendingCheckout');
+        
+        // 顯示成功消息（金額以伺服器重新計價的結果為準）
+        showToast(`訂單已成功提交！應付金額 ${result.total} 元，我們將盡快處理您的訂單`);
         
-        // 顯示成功消息
-        showToast('訂單已成功提交！我們將盡快處理您的訂單');
+        // 訂單確認後再提示一次（由伺服器推送，不需輪詢）
+        const unwatch = watchOrderStatus(result.orderId, (status) => {
+            if (status === 'processing') {
+                showToast('訂單已確認，正在為您備貨');
+            } else if (status === 'failed' || status === 'expired') {
+                showToast('訂單處理失敗，請聯絡客服');
+            }
+        });
         
         // 延遲後重定向到首頁
         setTimeout(() => {
+            unwatch();
             window.location.href = 'index.html';
         }, 3000);
     }).catch((error) => {
@@ -1,5 +1,5 @@
 // 在文件顶部添加导入语句
-import { getProducts, getProductsByCategory, submitOrder } from './api.js';
+import { getProducts, getProductsByCategory, getProductImageUrl, submitOrder } from './api.js';
 
 // 購物車資料
 let cart = [];
@@ -113,7 +113,7 @@ function renderProducts() {
         productCard.className = 'product-card';
         
         productCard.innerHTML = `
-            <img src="${product.image}" alt="${product.name}" class="product-image" onload="this.style.opacity='1'" onerror="this.onerror=null; this.src='https://via.placeholder.com/300x150?text=圖片載入失敗'; this.style.opacity='1';">
+            <img src="${getProductImageUrl(product.id, 480)}" srcset="${getProductImageUrl(product.id, 320)} 320w, ${getProductImageUrl(product.id, 480)} 480w, ${getProductImageUrl(product.id, 640)} 640w" sizes="(max-width: 480px) 50vw, 300px" alt="${product.name}" class="product-image" loading="lazy" data-fallback="${product.image}" onload="this.style.opacity='1'" onerror="if (this.dataset.fallback) { this.removeAttribute('srcset'); this.src = this.dataset.fallback; this.dataset.fallback = ''; } else { this.onerror = null; this.src = 'https://via.placeholder.com/300x150?text=圖片載入失敗'; this.style.opacity = '1'; }">
             <div class="product-info">
                 <h3 class="product-name">${product.name}</h3>
                 <p class="product-description">${product.description}</p>
@@ -249,7 +249,7 @@ function updateCartDisplay() {
             cartItemElement.className = 'cart-item';
             
             cartItemElement.innerHTML = `
-                <img src="${item.image}" alt="${item.name}" onerror="this.onerror=null; this.src='https://via.placeholder.com/50x50?text=無圖片'">
+                <img src="${getProductImageUrl(item.id, 160)}" alt="${item.name}" data-fallback="${item.image}" onerror="if (this.dataset.fallback) { this.src = this.dataset.fallback; this.dataset.fallback = ''; } else { this.onerror = null; this.src = 'https://via.placeholder.com/50x50?text=無圖片'; }">
                 <div class="cart-item-details">
                     <h3>${item.name}</h3>
                     <p class="cart-item-price ${item.onSale ? 'sale' : ''}">價格: $${item.price}</p>
@@ -1,10 +1,261 @@
-import http.server
-import socketserver
+"""手机版页面的静态文件服务器
+
+    python server.py --port 8000 --directory page
+
+- 多执行绪处理请求，慢的客户端不会卡住其他人
+- 启动时把 js/css/html 预先压缩成 .gz（装了brotli模块时另外产生 .br），依 Accept-Encoding 选择
+- 以 sendfile 传送文件内容
+- 所有文件都带 ETag 与 Last-Modified，支持 304
+- js/css 另外提供带内容哈希的网址（例如 script.1a2b3c4d.js），HTML与js内的引用会改写成这个网址，
+  这类网址的内容永远不变，可以长期缓存；HTML与原始网址则每次都向服务器确认
+"""
+import argparse
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+from email.utils import formatdate, parsedate_to_datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+try:
+    import brotli
+except ImportError:  # brotli为选用，没有安装时只提供gzip
+    brotli = None
 
 PORT = 8000
 
-Handler = http.server.SimpleHTTPRequestHandler
+# 需要预先压缩的文件类型
+COMPRESSIBLE = {".html", ".js", ".css", ".svg", ".json", ".txt"}
+# 提供带哈希网址的文件类型
+FINGERPRINTED = {".js", ".css"}
+# 其他可以提供的静态文件类型
+STATIC = COMPRESSIBLE | {".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico", ".woff", ".woff2"}
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+class Asset:
+    def __init__(self, content_type: str, mtime: float, cache_control: str, compressible: bool):
+        self.content_type = content_type
+        self.last_modified = formatdate(mtime, usegmt=True)
+        self.mtime = int(mtime)
+        self.cache_control = cache_control
+        self.compressible = compressible
+        # 编码 -> (文件路径, 大小, ETag)
+        self.variants: Dict[str, Tuple[str, int, str]] = {}
+
+
+# 找出文件内引用的其他资源（例如 src="script.js"、from './api.js'）
+def _reference_pattern(name: str) -> "re.Pattern[str]":
+    return re.compile(r"""(["'])(\./)?%s\1""" % re.escape(name))
+
+
+def _fingerprinted_name(name: str, content: bytes) -> str:
+    stem, extension = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:8]}{extension}"
+
+
+# 启动时建立所有资源：改写引用、计算哈希、产生压缩版本，写入build_dir
+def build_assets(directory: str, build_dir: str) -> Dict[str, Asset]:
+    names = sorted(
+        entry.name for entry in os.scandir(directory)
+        if entry.is_file() and not entry.name.startswith(".")
+        and os.path.splitext(entry.name)[1].lower() in STATIC
+    )
+    sources = {}
+    for name in names:
+        with open(os.path.join(directory, name), "rb") as f:
+            sources[name] = f.read()
+
+    fingerprints: Dict[str, str] = {}
+    contents: Dict[str, bytes] = {}
+    # 改写过的文件，修改时间取自己与所引用文件中最新的
+    mtimes = {name: os.path.getmtime(os.path.join(directory, name)) for name in names}
+
+    # 被引用的文件先处理，引用它的文件才能改写成带哈希的网址
+    def resolve(name: str, visiting: Tuple[str, ...] = ()) -> bytes:
+        if name in contents:
+            return contents[name]
+        content = sources[name]
+        if os.path.splitext(name)[1].lower() in COMPRESSIBLE:
+            text = content.decode("utf-8")
+            for other in names:
+                if other == name or other in visiting:
+                    continue
+                if os.path.splitext(other)[1].lower() not in FINGERPRINTED:
+                    continue
+                pattern = _reference_pattern(other)
+                if pattern.search(text):
+                    resolve(other, visiting + (name,))
+                    mtimes[name] = max(mtimes[name], mtimes[other])
+                    text = pattern.sub(lambda m: m.group(1) + (m.group(2) or "") + fingerprints[other] + m.group(1), text)
+            content = text.encode("utf-8")
+        contents[name] = content
+        if os.path.splitext(name)[1].lower() in FINGERPRINTED:
+            fingerprints[name] = _fingerprinted_name(name, content)
+        return content
+
+    assets: Dict[str, Asset] = {}
+    for name in names:
+        content = resolve(name)
+        extension = os.path.splitext(name)[1].lower()
+        compressible = extension in COMPRESSIBLE
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if compressible:
+            content_type += "; charset=utf-8"
+        digest = hashlib.sha256(content).hexdigest()[:16]
+
+        variants = _write_variants(build_dir, name, content, digest, compressible)
+        urls = [("/" + name, REVALIDATE)]
+        if name in fingerprints:
+            urls.append(("/" + fingerprints[name], IMMUTABLE))
+        for url, cache_control in urls:
+            asset = Asset(content_type, mtimes[name], cache_control, compressible)
+            asset.variants = variants
+            assets[url] = asset
+
+    if "/index.html" in assets:
+        assets["/"] = assets["/index.html"]
+    return assets
+
+
+def _write_variants(build_dir: str, name: str, content: bytes, digest: str, compressible: bool) -> Dict[str, Tuple[str, int, str]]:
+    encoded = {"identity": content}
+    if compressible:
+        encoded["gzip"] = gzip.compress(content, compresslevel=9, mtime=0)
+        if brotli is not None:
+            encoded["br"] = brotli.compress(content, quality=11)
+
+    variants = {}
+    for encoding, data in encoded.items():
+        # 压缩后反而更大就不提供
+        if encoding != "identity" and len(data) >= len(content):
+            continue
+        path = os.path.join(build_dir, f"{digest}.{encoding}.{name}")
+        with open(path, "wb") as f:
+            f.write(data)
+        suffix = "" if encoding == "identity" else "-" + encoding
+        variants[encoding] = (path, len(data), f'"{digest}{suffix}"')
+    return variants
+
+
+# 解析Accept-Encoding，返回客户端接受的编码
+def _accepted_encodings(header: Optional[str]) -> List[str]:
+    accepted = []
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding and quality > 0:
+            accepted.append(coding)
+    return accepted
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate == etag or candidate == "W/" + etag:
+            return True
+    return False
+
+
+class StaticHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "StaticServer"
+    assets: Dict[str, Asset] = {}
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def _serve(self, send_body: bool) -> None:
+        path = unquote(urlsplit(self.path).path)
+        asset = self.assets.get(path)
+        if asset is None:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return
+
+        encoding = "identity"
+        if asset.compressible:
+            accepted = _accepted_encodings(self.headers.get("Accept-Encoding"))
+            for candidate in ("br", "gzip"):
+                if candidate in asset.variants and candidate in accepted:
+                    encoding = candidate
+                    break
+        file_path, size, etag = asset.variants[encoding]
+
+        if self._not_modified(asset, etag):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self._send_common_headers(asset, etag)
+            self.end_headers()
+            return
+
+        self.send_response(HTTPStatus.OK)
+        self._send_common_headers(asset, etag)
+        self.send_header("Content-Type", asset.content_type)
+        self.send_header("Content-Length", str(size))
+        if encoding != "identity":
+            self.send_header("Content-Encoding", encoding)
+        self.end_headers()
+
+        if send_body:
+            self.wfile.flush()
+            with open(file_path, "rb") as f:
+                self.connection.sendfile(f)
+
+    def _send_common_headers(self, asset: Asset, etag: str) -> None:
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", asset.last_modified)
+        self.send_header("Cache-Control", asset.cache_control)
+        if asset.compressible:
+            self.send_header("Vary", "Accept-Encoding")
+
+    def _not_modified(self, asset: Asset, etag: str) -> bool:
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return _etag_matches(if_none_match, etag)
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return parsedate_to_datetime(if_modified_since).timestamp() >= asset.mtime
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser(description="手机版页面静态文件服务器")
+    parser.add_argument("--host", default="")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", PORT)))
+    parser.add_argument("--directory", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "page"))
+    args = parser.parse_args()
+
+    build_dir = tempfile.mkdtemp(prefix="static-")
+    try:
+        StaticHandler.assets = build_assets(args.directory, build_dir)
+        with ThreadingHTTPServer((args.host, args.port), StaticHandler) as httpd:
+            print(f"Server running at http://localhost:{args.port}")
+            httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
 
-with socketserver.TCPServer(("", PORT), Handler) as httpd:
-    print(f"Server running at http://localhost:{PORT}")
-    httpd.serve_forever()
+if __name__ == "__main__":
+    run()